@@ -0,0 +1,96 @@
+"""
+Recall, memory and latency of the quantized index against exact float32 search.
+
+Run from the repository root after `python -m data.build_quantized_index`:
+    python -m benchmarks.bench_quantized_search --queries 300
+Queries are chunk vectors with gaussian noise added; pass --model-queries to encode
+"<title> <section>" strings with the configured model instead. --synthetic N benchmarks a random
+clustered corpus of N vectors and needs neither the index nor the model.
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from llm.llm_quantized_index import QuantizedIndex
+
+
+def synthetic_index(size, dim, seed):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, size // 20), dim))
+    vectors = centers[rng.integers(len(centers), size=size)] + 0.5 * rng.normal(size=(size, dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [f"chunk-{i}" for i in range(size)]
+    return QuantizedIndex.build(ids, vectors, [{"id": i} for i in ids], ids)
+
+
+def noisy_queries(index, count, noise, seed):
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(index.ids), size=min(count, len(index.ids)), replace=False)
+    queries = np.asarray(index.vectors[np.sort(rows)]) + noise * rng.normal(size=(len(rows), index.vectors.shape[1]))
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+
+def model_queries(index, config, count, seed):
+    from sentence_transformers import SentenceTransformer
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(index.ids), size=min(count, len(index.ids)), replace=False)
+    texts = [f"{index.metadatas[i].get('title', '')} {index.metadatas[i].get('section', '')}" for i in rows]
+    if config.get('prepend_chunks_and_queries', False):
+        texts = [f"Represent this sentence for searching relevant passages: {text}" for text in texts]
+    model = SentenceTransformer(config['embedding_model']['name'])
+    return model.encode(texts, normalize_embeddings=True, show_progress_bar=False).astype(np.float32)
+
+
+def run(index, queries, top_k, first_stage, rescore):
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        rows, _ = index.search(query, top_k, first_stage=first_stage, rescore=rescore)
+        results.append(set(rows.tolist()))
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=None, help="defaults to retrieval_settings.top_k")
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--model-queries", action="store_true")
+    parser.add_argument("--synthetic", type=int, default=None, metavar="N")
+    parser.add_argument("--dim", type=int, default=768, help="dimension of the synthetic corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open("config.json", "r") as f:
+        config = json.load(f)
+    index_config = config['retrieval_settings'].get('quantized_index', {})
+    top_k = args.top_k or config['retrieval_settings']['top_k']
+
+    if args.synthetic:
+        index = synthetic_index(args.synthetic, args.dim, args.seed)
+    else:
+        index = QuantizedIndex.load(
+            os.path.join(index_config.get('path', "quantized_index"), config['embedding_model']['collection_name']),
+            candidate_multiplier=index_config.get('candidate_multiplier', 10)
+        )
+    queries = model_queries(index, config, args.queries, args.seed) if args.model_queries else noisy_queries(index, args.queries, args.noise, args.seed)
+
+    exact, exact_ms = run(index, queries, top_k, "exact", True)
+    memory = index.memory_usage()
+    print(f"{len(index.ids)} chunks, {len(queries)} queries, top_k={top_k}, candidate_multiplier={index.candidate_multiplier}")
+    print(f"{'method':<24}{'recall@k':>10}{'ms/query':>10}{'index KiB':>12}")
+    print(f"{'exact float32':<24}{1.0:>10.3f}{exact_ms:>10.3f}{memory['float32'] / 1024:>12.0f}")
+    for first_stage in ("binary", "int8"):
+        for rescore in (False, True):
+            found, ms = run(index, queries, top_k, first_stage, rescore)
+            recall = np.mean([len(f & e) / len(e) for f, e in zip(found, exact) if e])
+            label = f"{first_stage}{' + rescore' if rescore else ''}"
+            print(f"{label:<24}{recall:>10.3f}{ms:>10.3f}{memory[first_stage] / 1024:>12.0f}")
+    print("Rescoring reads only the shortlisted float32 rows from the memory-mapped file.")
+
+
+if __name__ == "__main__":
+    main()
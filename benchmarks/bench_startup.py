@@ -0,0 +1,102 @@
+"""
+Import-time and cold-start benchmark.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup --runs 5 --max-import-ms 300 --max-ready-ms 1500
+
+Each measurement runs in a fresh interpreter so nothing is already imported or cached in-process.
+Exits with status 1 when a median exceeds its budget, so it can gate startup regressions.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COLD_START = """
+import json, time
+start = time.perf_counter()
+from llm.llm_manager import LLMManager
+imported = time.perf_counter()
+with open("config.json", "r") as f:
+    config = json.load(f)
+manager = LLMManager(config, True)
+ready = time.perf_counter()
+manager.embedder.warm_up().wait()
+warm = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "ready_ms": (ready - start) * 1000,
+    "model_warm_ms": (warm - start) * 1000,
+}))
+"""
+
+
+def measure_importtime(module):
+    """
+    Cumulative import time of `module` in microseconds, and the slowest imports it pulled in,
+    parsed from `python -X importtime`.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        entries.append((int(cumulative_us), int(self_us), name.strip()))
+    total = next(cumulative for cumulative, _, name in entries if name == module)
+    return total, sorted(entries, reverse=True)[:10]
+
+
+def measure_cold_start():
+    result = subprocess.run(
+        [sys.executable, "-c", COLD_START],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--module", default="llm.llm_manager")
+    parser.add_argument("--skip-cold-start", action="store_true", help="only measure imports (no model or index needed)")
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    parser.add_argument("--max-ready-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    import_runs = []
+    for _ in range(args.runs):
+        total, slowest = measure_importtime(args.module)
+        import_runs.append(total / 1000)
+    report = {"import_ms": statistics.median(import_runs)}
+    print(f"import {args.module}: median {report['import_ms']:.1f} ms over {args.runs} runs")
+    print("slowest imports (last run, cumulative ms):")
+    for cumulative, _, name in slowest:
+        print(f"  {cumulative / 1000:8.1f}  {name}")
+
+    if not args.skip_cold_start:
+        cold_runs = [measure_cold_start() for _ in range(args.runs)]
+        for key in ("ready_ms", "model_warm_ms"):
+            report[key] = statistics.median(run[key] for run in cold_runs)
+        print(f"LLMManager usable after: median {report['ready_ms']:.1f} ms")
+        print(f"embedding model warm after: median {report['model_warm_ms']:.1f} ms")
+
+    failed = False
+    if args.max_import_ms is not None and report["import_ms"] > args.max_import_ms:
+        print(f"FAIL: import time {report['import_ms']:.1f} ms exceeds budget {args.max_import_ms} ms")
+        failed = True
+    if args.max_ready_ms is not None and report.get("ready_ms", 0) > args.max_ready_ms:
+        print(f"FAIL: cold start {report['ready_ms']:.1f} ms exceeds budget {args.max_ready_ms} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,56 +1,229 @@
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
-# --- SETUP ---
+from utils.tokens import CHARS_PER_TOKEN, estimate_tokens
 
+# --- SETUP ---
+# Shared by every history, summaries are infrequent and only need to stay off the request path.
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-summary")
 # ----------------
 
+def render_document(context):
+    return f"\n--- Document ---\n{context}\n--- Document End ---"
+
+def render_message(message):
+    return f"{message['role']}: {message['text']}"
+
 class ChatHistory:
-    def __init__(self, chat_limit=12, context_limit=6, logger=None):
-        self.message_history = []
-        self.context_history = []
+    def __init__(self, chat_limit=12, context_limit=6, chat_token_limit=None, context_token_limit=None,
+                 summarizer=None, summary_token_limit=200, summary_batch_messages=4, summary_batch_tokens=None,
+                 prefetch_limit=4, logger=None):
+        """
+        Bounded message and context queues, capped both by entry count and by estimated tokens.
+        Renderings are kept up to date incrementally as entries come and go, so reading the
+        history never re-joins it. Messages evicted from the window are folded into a rolling
+        summary by `summarizer(previous_summary, messages)` on a background thread, once
+        `summary_batch_messages` of them (or `summary_batch_tokens` worth) have piled up, so a full
+        window costs one summary call every few turns rather than one per evicted message.
+        Sections prefetched for the conversation's recent items are kept per history, for at most
+        `prefetch_limit` items.
+        """
+        self.message_history = deque()
+        self.context_history = deque()
         self.chat_limit = chat_limit
         self.context_limit = context_limit
+        self.chat_token_limit = chat_token_limit
+        self.context_token_limit = context_token_limit
+        self.summarizer = summarizer
+        self.summary_token_limit = summary_token_limit
+        self.summary_batch_messages = summary_batch_messages
+        self.summary_batch_tokens = summary_batch_tokens
         self.logger = logger
 
+        # Rendered entries and their token counts, parallel to the two histories.
+        self._message_lines = deque()
+        self._message_tokens = deque()
+        self._context_blocks = deque()
+        self._context_tokens = deque()
+        self.chat_tokens = 0
+        self.context_tokens = 0
+        self._chat_text = ""
+        self._context_text = ""
+        self._rendered = None
+
+        self.summary = ""
+        self.summary_tokens = 0
+        self._pending_summary = []
+        self._pending_summary_tokens = 0
+        self._summary_running = False
+        self._summary_lock = threading.Lock()
+
+        # item title (lowercased) -> {section (lowercased): document}, least recently used first.
+        self.prefetch_limit = prefetch_limit
+        self.prefetched = OrderedDict()
+        self._prefetch_lock = threading.Lock()
+
     def inqueue_message(self, role, message):
         if self.logger:
-            self.logger.info(f"Inqueue message: {role}: {message}")
+            self.logger.info("Inqueue message: %s: %s", role, message)
         if isinstance(message, str):
             message = {"role": role, "text": message}
+        line = render_message(message)
         self.message_history.append(message)
-        if len(self.message_history) > self.chat_limit:
+        self._message_lines.append(line)
+        self._message_tokens.append(estimate_tokens(line))
+        self.chat_tokens += self._message_tokens[-1]
+        self._chat_text = f"{self._chat_text}\n{line}" if len(self._message_lines) > 1 else line
+        self._rendered = None
+        # The newest message is always kept, even if it alone exceeds the token budget.
+        while len(self.message_history) > 1 and (
+            len(self.message_history) > self.chat_limit or
+            (self.chat_token_limit and self.chat_tokens > self.chat_token_limit)
+        ):
             self.dequeue_message()
 
     def dequeue_message(self):
+        if not self.message_history:
+            if self.logger:
+                self.logger.info("Dequeue message: None")
+            return None
+        message = self.message_history.popleft()
+        line = self._message_lines.popleft()
+        self.chat_tokens -= self._message_tokens.popleft()
+        self._chat_text = self._chat_text[len(line) + 1:] if self._message_lines else ""
+        self._rendered = None
         if self.logger:
-            self.logger.info(f"Dequeue message: {self.message_history[0] if self.message_history else 'None'}")
-        if self.message_history:
-            return self.message_history.pop(0)
-        return None
+            self.logger.info("Dequeue message: %s", message)
+        self._fold_into_summary(message, estimate_tokens(line))
+        return message
 
     def inqueue_context(self, context):
         if self.logger:
-            self.logger.info(f"Inqueue context: {context[:100]}...")
-        self.context_history.extend(context)
-        while len(self.context_history) > self.context_limit:
+            self.logger.info("Inqueue context: %s...", context[:100])
+        for item in context:
+            block = render_document(item)
+            self.context_history.append(item)
+            self._context_blocks.append(block)
+            self._context_tokens.append(estimate_tokens(item))
+            self.context_tokens += self._context_tokens[-1]
+            self._context_text = f"{self._context_text}\n{block}" if len(self._context_blocks) > 1 else block
+        self._rendered = None
+        while len(self.context_history) > 1 and (
+            len(self.context_history) > self.context_limit or
+            (self.context_token_limit and self.context_tokens > self.context_token_limit)
+        ):
             self.dequeue_context()
 
     def dequeue_context(self):
+        if not self.context_history:
+            if self.logger:
+                self.logger.info("Dequeue context: None...")
+            return None
+        context = self.context_history.popleft()
+        block = self._context_blocks.popleft()
+        self.context_tokens -= self._context_tokens.popleft()
+        self._context_text = self._context_text[len(block) + 1:] if self._context_blocks else ""
+        self._rendered = None
         if self.logger:
-            self.logger.info(f"Dequeue context: {self.context_history[0][:100] if self.context_history else 'None'}...")
-        if self.context_history:
-            return self.context_history.pop(0)
-        return None
+            self.logger.info("Dequeue context: %s...", context[:100])
+        return context
 
-    def __str__(self):
-        return (
-            "Previous Context:\n" +
-            "\n".join([f"\n--- Document ---\n{c}\n--- Document End ---" for c in self.context_history]) +
-            "\nPrevious Messages:\n" +
-            "\n".join([f"{m['role']}: {m['text']}" for m in self.message_history])
+    def _summary_due(self):
+        return len(self._pending_summary) >= self.summary_batch_messages or bool(
+            self.summary_batch_tokens and self._pending_summary_tokens >= self.summary_batch_tokens
         )
-    
+
+    def _fold_into_summary(self, message, tokens):
+        if not self.summarizer:
+            return
+        with self._summary_lock:
+            self._pending_summary.append(message)
+            self._pending_summary_tokens += tokens
+            if self._summary_running or not self._summary_due():
+                return
+            self._summary_running = True
+        _summary_executor.submit(self._summarize_pending)
+
+    def _summarize_pending(self):
+        # A full batch evicted while a summary is being written is picked up by the next pass of this loop.
+        while True:
+            with self._summary_lock:
+                if not self._summary_due():
+                    self._summary_running = False
+                    return
+                batch, self._pending_summary = self._pending_summary, []
+                self._pending_summary_tokens = 0
+                previous = self.summary
+            try:
+                summary = self.summarizer(previous, batch)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error("Failed to summarize evicted messages: %s", e)
+                continue
+            if not summary:
+                continue
+            summary = summary.strip()[:self.summary_token_limit * CHARS_PER_TOKEN]
+            with self._summary_lock:
+                self.summary = summary
+                self.summary_tokens = estimate_tokens(summary)
+                self._rendered = None
+
+    def store_prefetched(self, title, sections):
+        """
+        Keep the prefetched `sections` ({section: document}) of an item for follow-up questions.
+        """
+        with self._prefetch_lock:
+            self.prefetched[title.lower()] = {section.lower(): document for section, document in sections.items()}
+            self.prefetched.move_to_end(title.lower())
+            while len(self.prefetched) > self.prefetch_limit:
+                self.prefetched.popitem(last=False)
+
+    def has_prefetched(self, title):
+        with self._prefetch_lock:
+            return title.lower() in self.prefetched
+
+    def lookup_prefetched(self, title, section):
+        if not title or not section:
+            return None
+        with self._prefetch_lock:
+            sections = self.prefetched.get(title.lower())
+            if sections is None:
+                return None
+            self.prefetched.move_to_end(title.lower())
+            return sections.get(section.lower())
+
+    def token_count(self):
+        """
+        Estimated tokens of the full rendered history, summary included.
+        """
+        return self.summary_tokens + self.context_tokens + self.chat_tokens
+
+    def __str__(self):
+        rendered = self._rendered
+        if rendered is None:
+            summary = self.summary
+            rendered = (
+                (f"Conversation Summary:\n{summary}\n" if summary else "") +
+                "Previous Context:\n" +
+                self._context_text +
+                "\nPrevious Messages:\n" +
+                self._chat_text
+            )
+            # The summary may have been replaced by the background worker while rendering.
+            if summary is self.summary:
+                self._rendered = rendered
+        return rendered
+
     def get_chat(self):
-        return f'{"\n".join([f"{m["role"]}: {m["text"]}" for m in self.message_history])}'
+        """
+        The recent messages, preceded by the summary of evicted ones so the rewrite and focus
+        calls see the whole conversation too.
+        """
+        summary = self.summary
+        if summary:
+            return f"Conversation Summary:\n{summary}\n{self._chat_text}"
+        return self._chat_text
 
     def get_context(self):
-        return "\n".join([f"\n--- Document ---\n{c}\n--- Document End ---" for c in self.context_history])
\ No newline at end of file
+        return self._context_text
@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import OrderedDict
+
+# --- SETUP ---
+
+# ----------------
+
+class Session:
+    def __init__(self, session_id, chat_history, now):
+        self.session_id = session_id
+        self.chat_history = chat_history
+        self.last_used = now
+        # Turns of one conversation must not interleave, different sessions run concurrently.
+        self.lock = threading.Lock()
+
+
+class SessionStore:
+    def __init__(self, factory, max_sessions=256, idle_timeout=1800, clock=time.monotonic, logger=None):
+        """
+        Session table mapping session ids to their own chat history.
+        Sessions idle for longer than `idle_timeout` seconds are evicted, and once `max_sessions`
+        is reached the least recently used session makes room for the new one.
+        """
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self.logger = logger
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session_id):
+        """
+        Return the session for `session_id`, creating it if needed, and mark it as used.
+        """
+        with self.lock:
+            now = self.clock()
+            self._evict_idle(now)
+            session = self.sessions.get(session_id)
+            if session is None:
+                while len(self.sessions) >= self.max_sessions:
+                    evicted_id, _ = self.sessions.popitem(last=False)
+                    if self.logger: self.logger.info("Session limit reached, evicted session %s", evicted_id)
+                session = self.sessions[session_id] = Session(session_id, self.factory(), now)
+            else:
+                self.sessions.move_to_end(session_id)
+            session.last_used = now
+            return session
+
+    def drop(self, session_id):
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    def evict_idle(self):
+        with self.lock:
+            self._evict_idle(self.clock())
+
+    def _evict_idle(self, now):
+        # Sessions are kept in last-used order, so idle ones are always at the front.
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if now - session.last_used <= self.idle_timeout:
+                break
+            del self.sessions[session_id]
+            if self.logger: self.logger.info("Evicted idle session %s", session_id)
+
+    def __len__(self):
+        return len(self.sessions)
@@ -0,0 +1,67 @@
+# Run from the repository root: python -m data.build_quantized_index
+import json
+import logging
+import datetime
+import os
+
+from sentence_transformers import SentenceTransformer
+
+from llm.llm_quantized_index import QuantizedIndex
+
+with open("config.json", "r") as f:
+    config = json.load(f)
+
+log_dir = "logs/build_quantized_index"
+if not os.path.exists(log_dir):
+    os.makedirs(log_dir)
+current_time = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+log_file = os.path.join(log_dir, f"{current_time}.log")
+logging.basicConfig(filename=log_file, level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+def load_data(file_path):
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    file_path = os.path.join(base_dir, file_path)
+    with open(file_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data
+
+def build_quantized_index(data, model):
+  """
+  Embeds every chunk the same way embed_and_vectorize does and stores the float32 vectors
+  alongside their binary and int8 codes.
+  """
+  texts = []
+  for chunk in data:
+    text_to_embed = chunk["text"]
+    if config.get('prepend_chunks_and_queries', True):
+      text_to_embed = f"Represent this sentence for searching relevant passages: {text_to_embed}"
+    texts.append(text_to_embed)
+  embeddings = model.encode(
+    texts, normalize_embeddings=True,
+    batch_size=64, show_progress_bar=True
+  )
+  return QuantizedIndex.build(
+    [chunk["id"] for chunk in data],
+    embeddings,
+    [{**chunk["meta"], "id": chunk["id"]} for chunk in data],
+    texts
+  )
+
+if __name__ == "__main__":
+    index_config = config['retrieval_settings'].get('quantized_index', {})
+    output_path = os.path.join(index_config.get('path', "quantized_index"), config['embedding_model']['collection_name'])
+
+    logging.info("Loading data from all_chunks.json...")
+    data = load_data("all_chunks.json")
+    logging.info(f"Loaded {len(data)} chunks.")
+
+    logging.info("Loading embedding model...")
+    model = SentenceTransformer(config['embedding_model']['name'])
+
+    logging.info("Embedding and quantizing chunks...")
+    index = build_quantized_index(data, model)
+    index.save(output_path)
+    for representation, size in index.memory_usage().items():
+      logging.info(f"{representation}: {size / 1024:.0f} KiB")
+    logging.info(f"Quantized index saved to {output_path}")
@@ -1,7 +1,10 @@
+# Run from the repository root: python -m data.download_data
 import requests
 from tqdm import tqdm
 from langdetect import detect
 
+from data.page_archive import PageArchive
+
 API = "https://enterthegungeon.fandom.com/api.php"
 HEADERS = {"User-Agent": "RAG-ing-Gungeoneer/1.0"}
 
@@ -23,11 +26,31 @@ def get_all_pages():
         cmcontinue = response['continue']['apcontinue']
     return pages
 
+def fetch_latest_revids(titles, batch_size=50):
+    """
+    Current revision id of every title, asking for ids only, `batch_size` titles per request.
+    """
+    revids = {}
+    for start in range(0, len(titles), batch_size):
+        params = {
+            "action": "query",
+            "prop": "revisions",
+            "rvprop": "ids",
+            "formatversion": "2",
+            "format": "json",
+            "titles": "|".join(titles[start:start + batch_size])
+        }
+        response = requests.get(API, params=params, headers=HEADERS).json()
+        for page in response.get("query", {}).get("pages", []):
+            if "revisions" in page:
+                revids[page["title"]] = page["revisions"][0]["revid"]
+    return revids
+
 def fetch_page_content(title):
     params = {
         "action": "query",
         "prop": "revisions",
-        "rvprop": "content",
+        "rvprop": "content|ids",
         "rvslots": "main",
         "formatversion": "2",
         "format": "json",
@@ -36,23 +59,32 @@ def fetch_page_content(title):
     response = requests.get(API, params=params, headers=HEADERS).json()
     pages = response.get("query", {}).get("pages", [])
     if pages and "revisions" in pages[0]:
-        return pages[0]["revisions"][0]["slots"]["main"]["content"]
-    return ""
+        revision = pages[0]["revisions"][0]
+        return revision["slots"]["main"]["content"], revision["revid"]
+    return "", None
 
 pages = get_all_pages()
 print(f"Found {len(pages)} pages.")
 
-# Create directory if it doesn't exist, adjacent to the script
+# Pages are appended to a packed archive adjacent to the script; re-running only downloads pages
+# whose current revision is not archived yet
 import os
 base_dir = os.path.dirname(os.path.abspath(__file__))
-os.makedirs(os.path.join(base_dir, "gungeon_pages"), exist_ok=True)
- 
-for title in tqdm(pages):
-    content = fetch_page_content(title)
+archive = PageArchive(os.path.join(base_dir, "gungeon_archive"))
+
+revids = fetch_latest_revids(pages)
+stale = [
+    title for title in pages
+    if title not in archive.entries or archive.entries[title]["revid"] != revids.get(title)
+]
+print(f"{len(pages) - len(stale)} pages unchanged since the last download.")
+
+for title in tqdm(stale):
+    content, revid = fetch_page_content(title)
     if not content or len(content.strip()) < 20:
         continue  # Skip empty or too-short content
     if detect(content) != "en":
         continue
-    path = os.path.join(base_dir, "gungeon_pages", f"{title.replace('/', '_')}.txt")
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(content)
+    archive.append(title, revid, content)
+archive.close()
+print(f"Archived {len(archive)} pages.")
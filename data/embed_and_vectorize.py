@@ -33,6 +33,8 @@ def embed_and_vectorize_data(data, model_name, model):
   collection_name = f"rag_etg_{model_name}"
   collection = client.get_or_create_collection(
     name=collection_name,
+    # Lets running pipelines notice the re-index and drop answers cached against the old data.
+    metadata={"indexed_at": datetime.datetime.now().isoformat()},
     configuration={
       "hnsw": {
         "ef_construction": 200,
@@ -0,0 +1,127 @@
+import json
+import mmap
+import os
+import threading
+
+import zstandard
+
+# Raw pages packed into a few append-only shard files instead of one .txt per page.
+# Every page is its own zstd frame, so a page can be read back from (shard, offset, length) alone,
+# and a full scan reads each shard front to back. index.jsonl is append-only as well; the last
+# entry for a title is its current revision.
+
+class PageArchive:
+    def __init__(self, directory, shard_size=64 * 1024 * 1024, level=9):
+        self.directory = directory
+        self.shard_size = shard_size
+        self.compressor = zstandard.ZstdCompressor(level=level)
+        self.decompressor = zstandard.ZstdDecompressor()
+        self.index_path = os.path.join(directory, "index.jsonl")
+        self.entries = {}
+        self.revisions = {}
+        self.shard = 0
+        self._maps = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        # Cut off an index line left unfinished by an interrupted append before appending after it.
+        with open(self.index_path, "rb+") as f:
+            content = f.read()
+            if content and not content.endswith(b"\n"):
+                f.truncate(content.rfind(b"\n") + 1)
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Interrupted append: the page is simply fetched again on the next download.
+                    continue
+                self.entries[entry["title"]] = entry
+                self.revisions[(entry["title"], entry["revid"])] = entry
+                self.shard = max(self.shard, entry["shard"])
+
+    def _shard_path(self, shard):
+        return os.path.join(self.directory, f"pages-{shard:05d}.zst")
+
+    def _current_shard(self, incoming):
+        path = self._shard_path(self.shard)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size and size + incoming > self.shard_size:
+            self.shard += 1
+        return self.shard
+
+    def append(self, title, revid, content):
+        """
+        Store a page revision. Returns False if this exact revision is already archived.
+        """
+        with self._lock:
+            current = self.entries.get(title)
+            if current is not None and current["revid"] == revid:
+                return False
+            frame = self.compressor.compress(content.encode("utf-8"))
+            shard = self._current_shard(len(frame))
+            with open(self._shard_path(shard), "ab") as f:
+                offset = f.tell()
+                f.write(frame)
+            entry = {"title": title, "revid": revid, "shard": shard, "offset": offset, "length": len(frame)}
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.entries[title] = entry
+            self.revisions[(title, revid)] = entry
+            # A mapped shard does not see bytes appended after it was mapped.
+            self._close_map(shard)
+            return True
+
+    def _map(self, shard):
+        if shard not in self._maps:
+            f = open(self._shard_path(shard), "rb")
+            self._maps[shard] = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return self._maps[shard][1]
+
+    def _close_map(self, shard):
+        if shard in self._maps:
+            f, mapped = self._maps.pop(shard)
+            mapped.close()
+            f.close()
+
+    def _read(self, entry):
+        mapped = self._map(entry["shard"])
+        return self.decompressor.decompress(mapped[entry["offset"]:entry["offset"] + entry["length"]]).decode("utf-8")
+
+    def get(self, title, revid=None):
+        """
+        Content of revision `revid` of `title` (the latest archived one by default), or None if
+        it is not archived. Older revisions stay readable as long as their shard is kept.
+        """
+        with self._lock:
+            entry = self.entries.get(title) if revid is None else self.revisions.get((title, revid))
+            if entry is None:
+                return None
+            return self._read(entry)
+
+    def __contains__(self, title):
+        return title in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def iter_pages(self):
+        """
+        Yield (title, revid, content) for the current revision of every page, in shard order
+        so each shard is read sequentially.
+        """
+        with self._lock:
+            entries = sorted(self.entries.values(), key=lambda entry: (entry["shard"], entry["offset"]))
+        for entry in entries:
+            with self._lock:
+                content = self._read(entry)
+            yield entry["title"], entry["revid"], content
+
+    def close(self):
+        with self._lock:
+            for shard in list(self._maps):
+                self._close_map(shard)
@@ -1,3 +1,4 @@
+# Run from the repository root: python -m data.prepare_data
 import os
 import mwparserfromhell
 import logging
@@ -73,6 +74,78 @@ def clean_links_and_templates(text, filename):
     return text.strip()
 
 
+LINK_TARGET_PATTERN = re.compile(r"\[\[([^\|\]#]+)")
+NON_PAGE_NAMESPACES = ("category:", "file:", "image:")
+
+def extract_link_targets(wikitext):
+    """
+    Page titles linked from a piece of wikitext.
+    The first argument of {{Synergy|...}} is the synergy's own name, not a page; partner items are
+    the wikilinks inside the template text, which the link pattern already picks up.
+    """
+    targets = LINK_TARGET_PATTERN.findall(wikitext)
+    return [t.strip() for t in targets if t.strip() and not t.strip().lower().startswith(NON_PAGE_NAMESPACES)]
+
+def parse_wikitext(content, title, filename):
+    """
+    Parses one page of wikitext into its title, infobox and sections.
+    `filename` is only used to name the page in rewritten Synergy templates.
+    """
+    wikicode = mwparserfromhell.parse(content)
+
+    # Extract infobox
+    infobox = None
+    for template in wikicode.filter_templates():
+        if "infobox" in template.name.lower():
+            infobox = {param.name.strip(): clean_links_and_templates(str(param.value), filename) for param in template.params}
+            break
+
+    # Extract and group sections
+    sections = []
+    current_section = {"heading": "Summary", "content": [], "links": []}
+
+    for node in wikicode.nodes:
+      if isinstance(node, mwparserfromhell.nodes.Heading):
+          if current_section["content"]:
+              sections.append(current_section)
+          current_section = {"heading": str(node.title).strip(), "content": [], "links": []}
+
+      elif isinstance(node, mwparserfromhell.nodes.Text):
+          lines = str(node).split("\n")
+          for line in lines:
+              if line.strip():
+                  current_section["content"].append(line.strip())
+
+      elif isinstance(node, mwparserfromhell.nodes.Wikilink):
+          target = str(node.title).strip()
+          text = str(node.text).strip() if node.text else target
+          current_section["content"].append(f"{text} ({target})")
+          current_section["links"].extend(extract_link_targets(str(node)))
+
+      elif isinstance(node, mwparserfromhell.nodes.Template):
+        # skip infobox as it was already handled before
+        if "infobox" in node.name.lower():
+            continue
+        # Handle other templates
+        cleaned_template = clean_links_and_templates(str(node), filename)
+        current_section["content"].append(f"{cleaned_template}")
+        current_section["links"].extend(extract_link_targets(str(node)))
+      elif isinstance(node, mwparserfromhell.nodes.Tag):
+        if node.wiki_markup:
+            current_section["content"].append(node.wiki_markup.strip())
+
+    # Add last section
+    if current_section["content"]:
+        sections.append(current_section)
+    # Collapse bullet points
+    for section in sections:
+        section["content"] = collapse_bullet_points(section["content"])
+    return {
+        "title": title,
+        "infobox": infobox if infobox else {},
+        "sections": sections
+    }
+
 def parse_wikitext_files(input_directory="gungeon_pages", output_directory="parsed_gungeon_pages_json"):
     logging.info(f"Starting to parse wikitext files from '{input_directory}' to '{output_directory}'.")
     if not os.path.isdir(input_directory):
@@ -89,63 +162,10 @@ def parse_wikitext_files(input_directory="gungeon_pages", output_directory="pars
             try:
                 with open(input_filepath, 'r', encoding='utf-8') as f:
                     content = f.read()
-
-                wikicode = mwparserfromhell.parse(content)
-
                 # Extract title from filename
                 title = filename.replace(".txt", "").replace("_", " ")
-
-                # Extract infobox
-                infobox = None
-                for template in wikicode.filter_templates():
-                    if "infobox" in template.name.lower():
-                        infobox = {param.name.strip(): clean_links_and_templates(str(param.value), filename) for param in template.params}
-                        break
-
-                # Extract and group sections
-                sections = []
-                current_section = {"heading": "Summary", "content": []}
-
-                for node in wikicode.nodes:
-                  if isinstance(node, mwparserfromhell.nodes.Heading):
-                      if current_section["content"]:
-                          sections.append(current_section)
-                      current_section = {"heading": str(node.title).strip(), "content": []}
-
-                  elif isinstance(node, mwparserfromhell.nodes.Text):
-                      lines = str(node).split("\n")
-                      for line in lines:
-                          if line.strip():
-                              current_section["content"].append(line.strip())
-
-                  elif isinstance(node, mwparserfromhell.nodes.Wikilink):
-                      target = str(node.title).strip()
-                      text = str(node.text).strip() if node.text else target
-                      current_section["content"].append(f"{text} ({target})")
-
-                  elif isinstance(node, mwparserfromhell.nodes.Template):
-                    # skip infobox as it was already handled before
-                    if "infobox" in node.name.lower():
-                        continue
-                    # Handle other templates
-                    cleaned_template = clean_links_and_templates(str(node), filename)
-                    current_section["content"].append(f"{cleaned_template}")
-                  elif isinstance(node, mwparserfromhell.nodes.Tag):
-                    if node.wiki_markup:
-                        current_section["content"].append(node.wiki_markup.strip())
-
-                # Add last section
-                if current_section["content"]:
-                    sections.append(current_section)
-                # Collapse bullet points
-                for section in sections:
-                    section["content"] = collapse_bullet_points(section["content"])
                 # Save as JSON
-                result = {
-                    "title": title,
-                    "infobox": infobox if infobox else {},
-                    "sections": sections
-                }
+                result = parse_wikitext(content, title, filename)
 
                 output_filepath = os.path.join(output_directory, filename.replace(".txt", ".json"))
                 with open(output_filepath, 'w', encoding='utf-8') as out:
@@ -157,6 +177,28 @@ def parse_wikitext_files(input_directory="gungeon_pages", output_directory="pars
                 logging.exception(f"Error processing file {input_filepath}: {e}")
     logging.info(f"Finished parsing wikitext files.")
 
+def is_redirect(content):
+    lines = content.splitlines()
+    return len(lines) == 1 and lines[0].strip().upper().startswith("#REDIRECT")
+
+def parse_archive_pages(archive):
+    """
+    Parses every page of a PageArchive in one sequential scan, skipping redirects.
+    Pages are keyed by their real title, so titles differing only by '/' and '_' no longer collide.
+    """
+    logging.info(f"Starting to parse {len(archive)} archived pages from '{archive.directory}'.")
+    pages = []
+    for title, revid, content in archive.iter_pages():
+        if is_redirect(content):
+            logging.info(f"Skipped redirect page: {title}")
+            continue
+        try:
+            pages.append(parse_wikitext(content, title, f"{title}.txt"))
+        except Exception as e:
+            logging.exception(f"Error processing archived page {title} (revision {revid}): {e}")
+    logging.info(f"Finished parsing {len(pages)} archived pages.")
+    return pages
+
 def flatten_infobox_text(infobox_dict):
     lines = []
     for key, value in infobox_dict.items():
@@ -182,7 +224,8 @@ def flatten_section(title, section, infobox=None):
         "meta": {
             "title": title,
             "section": section_title
-        }
+        },
+        "links": section.get("links", [])
     }
 
 def flatten_page(page):
@@ -245,6 +288,29 @@ def augment_chunks(chunks):
         chunk["text"] = augment_text_chunk(chunk)
     return chunks
 
+def normalize_title(target):
+    target = target.replace("_", " ").strip()
+    return target[:1].upper() + target[1:]
+
+def build_link_graph(chunks):
+    """
+    Adjacency index from chunk id to the page titles it links to.
+    Only links to pages that have chunks are kept, so every neighbour can be looked up by id.
+    Pops the raw "links" from the chunks, all_chunks.json stays as it was.
+    """
+    titles = {chunk["meta"]["title"] for chunk in chunks}
+    graph = {}
+    for chunk in chunks:
+        own_title = chunk["meta"]["title"]
+        neighbours = []
+        for target in chunk.pop("links", []):
+            target = normalize_title(target)
+            if target in titles and target != own_title and target not in neighbours:
+                neighbours.append(target)
+        if neighbours:
+            graph[chunk["id"]] = neighbours
+    return graph
+
 def filter_irrelevant_chunks(chunks):
     """
     Filters out irrelevant chunks: 
@@ -262,20 +328,33 @@ def filter_irrelevant_chunks(chunks):
     return filtered_chunks
 
 if __name__ == "__main__":
-    logging.info("Starting cleanup...")
-    clean_redirect_files(os.path.join(base_dir, "gungeon_pages"))
-    logging.info("Cleanup finished.")
-    logging.info("Starting parsing...")
-    parse_wikitext_files(
-            os.path.join(base_dir, "gungeon_pages"), 
+    archive_dir = os.path.join(base_dir, "gungeon_archive")
+    if os.path.exists(os.path.join(archive_dir, "index.jsonl")):
+        from data.page_archive import PageArchive
+        logging.info("Starting parsing from the page archive...")
+        archive = PageArchive(archive_dir)
+        parsed_pages = parse_archive_pages(archive)
+        archive.close()
+        logging.info("Parsing finished.")
+        logging.info("Starting flattening...")
+        chunks = [chunk for page in parsed_pages for chunk in flatten_page(page)]
+        logging.info("Flattening finished.")
+    else:
+        # Legacy layout: one .txt file per page in gungeon_pages/
+        logging.info("Starting cleanup...")
+        clean_redirect_files(os.path.join(base_dir, "gungeon_pages"))
+        logging.info("Cleanup finished.")
+        logging.info("Starting parsing...")
+        parse_wikitext_files(
+                os.path.join(base_dir, "gungeon_pages"), 
+                os.path.join(base_dir, "parsed_gungeon_pages_json")
+        )
+        logging.info("Parsing finished.")
+        logging.info("Starting flattening...")
+        chunks = load_and_flatten_pages(
             os.path.join(base_dir, "parsed_gungeon_pages_json")
-    )
-    logging.info("Parsing finished.")
-    logging.info("Starting flattening...")
-    chunks = load_and_flatten_pages(
-        os.path.join(base_dir, "parsed_gungeon_pages_json")
-    )
-    logging.info("Flattening finished.")
+        )
+        logging.info("Flattening finished.")
     logging.info(f"Total chunks: {len(chunks)}")
     logging.info("Filtering irrelevant chunks...")
     chunks = filter_irrelevant_chunks(chunks)
@@ -287,6 +366,13 @@ if __name__ == "__main__":
     chunks = filter_english_chunks(chunks)
     logging.info(f"Total English chunks: {len(chunks)}")
     
+    logging.info("Building link graph...")
+    link_graph = build_link_graph(chunks)
+    link_graph_path = os.path.join(base_dir, "link_graph.json")
+    with open(link_graph_path, "w", encoding="utf-8") as f:
+        json.dump(link_graph, f, ensure_ascii=False)
+    logging.info(f"Link graph with {len(link_graph)} linked chunks saved to {link_graph_path}.")
+
     logging.info("Saving chunks to JSON file...")
     chunks_path = os.path.join(base_dir, "all_chunks.json")
     with open(chunks_path, "w", encoding="utf-8") as f:
@@ -1,3 +1,8 @@
-from .llm_manager import LLMManager
+__all__ = ['LLMManager']
 
-__all__ = ['LLMManager']
\ No newline at end of file
+def __getattr__(name):
+    # Imported on first access so `import llm` stays cheap; the manager pulls in every submodule.
+    if name == 'LLMManager':
+        from .llm_manager import LLMManager
+        return LLMManager
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
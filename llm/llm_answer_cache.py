@@ -0,0 +1,140 @@
+# ----- SETUP -----
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+from llm.llm_tracing import metrics, tracer
+# -----------------
+
+
+class AnswerCache:
+    def __init__(self, fingerprint=None, similarity_threshold=0.95, max_entries=512, check_interval=30.0,
+                 clock=time.monotonic, logger=None):
+        """
+        Answers to stateless queries, keyed by the embedding of the reformulated query.
+        A stored answer is served only if the query retrieved the same chunk ids and its embedding
+        has a cosine similarity of at least `similarity_threshold` with the stored one.
+        `fingerprint()` identifies the indexed collection. It is checked at most every `check_interval`
+        seconds and the cache is cleared when it changes. Past `max_entries`, the least recently
+        used answer is evicted.
+        """
+        self.fingerprint = fingerprint
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self.clock = clock
+        self.logger = logger
+        self.entries = OrderedDict()
+        # Chunk-id set -> entry keys, so a lookup only compares embeddings that retrieved the same chunks.
+        self.by_chunks = {}
+        self._keys = itertools.count()
+        self._fingerprint = None
+        self._checked_at = None
+        self.lock = threading.Lock()
+
+        self.size = metrics.gauge("rag_answer_cache_entries", "Answers currently held by the answer cache.")
+        self.saved_seconds = metrics.counter(
+            "rag_answer_cache_saved_seconds_total", "Answer generation time skipped by answer cache hits."
+        )
+
+    @staticmethod
+    def _normalize(embedding):
+        # Plain floats: only entries that retrieved the same chunks are compared, so this stays cheap
+        # and importing the manager does not pull in numpy.
+        vector = [float(x) for x in embedding]
+        norm = sum(x * x for x in vector) ** 0.5
+        return [x / norm for x in vector] if norm else vector
+
+    def _check_fingerprint(self):
+        if self.fingerprint is None:
+            return
+        with self.lock:
+            now = self.clock()
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return
+            # Claimed before fingerprinting, so concurrent callers do not all hit the index.
+            self._checked_at = now
+        # The fingerprint queries the index, so it runs outside the lock and lookups are not held up.
+        try:
+            fingerprint = self.fingerprint()
+        except Exception as e:
+            # Without a fingerprint a re-index could go unnoticed, so start over.
+            if self.logger: self.logger.error("Failed to fingerprint the index, clearing the answer cache: %s", e)
+            fingerprint = None
+        with self.lock:
+            if fingerprint != self._fingerprint or fingerprint is None:
+                if self.entries and self.logger:
+                    self.logger.info("Index changed, dropping %d cached answers", len(self.entries))
+                self._clear()
+                self._fingerprint = fingerprint
+
+    def lookup(self, embedding, chunk_ids):
+        """
+        The cached answer for this query, or None.
+        """
+        vector = self._normalize(embedding)
+        self._check_fingerprint()
+        with self.lock:
+            best, best_similarity = None, self.similarity_threshold
+            for key in self.by_chunks.get(frozenset(chunk_ids), ()):
+                similarity = sum(a * b for a, b in zip(self.entries[key][1], vector))
+                if similarity >= best_similarity:
+                    best, best_similarity = key, similarity
+            if best is not None:
+                self.entries.move_to_end(best)
+                answer, seconds = self.entries[best][2:]
+        tracer.record_cache("answer", best is not None)
+        if best is None:
+            return None
+        self.saved_seconds.inc(seconds)
+        if self.logger: self.logger.info("Answer cache hit (similarity %.3f)", best_similarity)
+        return answer
+
+    def store(self, embedding, chunk_ids, answer, seconds):
+        """
+        Cache `answer`, which took `seconds` to generate.
+        """
+        chunks = frozenset(chunk_ids)
+        vector = self._normalize(embedding)
+        self._check_fingerprint()
+        with self.lock:
+            key = next(self._keys)
+            self.entries[key] = (chunks, vector, answer, seconds)
+            self.by_chunks.setdefault(chunks, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+            self.size.set(len(self.entries))
+
+    def _remove(self, key):
+        chunks = self.entries.pop(key)[0]
+        keys = self.by_chunks[chunks]
+        keys.discard(key)
+        if not keys:
+            del self.by_chunks[chunks]
+
+    def _clear(self):
+        self.entries.clear()
+        self.by_chunks.clear()
+        self.size.set(0)
+
+    def clear(self):
+        with self.lock:
+            self._clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        """
+        Hit rate and answer time saved so far.
+        """
+        hits = tracer.cache_lookups.get(cache="answer", result="hit")
+        misses = tracer.cache_lookups.get(cache="answer", result="miss")
+        return {
+            "entries": len(self.entries),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "saved_seconds": self.saved_seconds.get(),
+        }
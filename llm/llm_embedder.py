@@ -1,32 +1,94 @@
 import json
-from sentence_transformers import SentenceTransformer
+import threading
+from llm.llm_embedding_batcher import EmbeddingBatcher
+from llm.llm_scheduler import PRIORITY_REWRITE
+from llm.llm_tracing import tracer
 
 # --- SETUP ---
-with open("config.json", "r") as f:
-    config = json.load(f)
+
 # ----------------
 
 class LLMEmbedder:
-	def __init__(self, engine, config, logger=None):
-			self.model = SentenceTransformer(
-     config['embedding_model']['name'],
-     device='cuda' if config['embedding_model']['use_gpu'] else 'cpu',
-     )
+	def __init__(self, engine, config, logger=None, warm_up=True):
+			"""
+			The SentenceTransformer is loaded on a background thread so the caller is usable right away.
+			The first `embed` call blocks until the model is ready.
+			"""
+			self.config = config
+			self.device = 'cuda' if config['embedding_model']['use_gpu'] else 'cpu'
 			self.engine = engine
 			self.logger = logger
+			self._model = None
+			self._load_error = None
+			self._ready = threading.Event()
+			self._load_lock = threading.Lock()
+			self._loader = None
+			# Concurrent single-text embeds (e.g. several server sessions) share model calls.
+			batching = config['embedding_model'].get('batching', {})
+			self.batcher = None
+			if batching.get('enabled', False):
+				self.batcher = EmbeddingBatcher(
+					self._encode,
+					max_batch_size=batching.get('max_batch_size', 32),
+					max_wait_ms=batching.get('max_wait_ms', 5),
+				)
+			if warm_up:
+				self.warm_up()
 
-	def embed(self, text):
+	def warm_up(self):
+			"""
+			Start loading the embedding model in the background, if it is not loading already.
+			"""
+			with self._load_lock:
+				if self._loader is None:
+					self._loader = threading.Thread(target=self._load_model, name="embedder-warm-up", daemon=True)
+					self._loader.start()
+			return self._ready
+
+	def _load_model(self):
+			try:
+				with tracer.span("model_load"):
+					# Deferred import, sentence_transformers pulls in torch and takes seconds on its own.
+					from sentence_transformers import SentenceTransformer
+					self._model = SentenceTransformer(
+						self.config['embedding_model']['name'],
+						device=self.device,
+					)
+				if self.logger: self.logger.info("Embedding model %s loaded", self.config['embedding_model']['name'])
+			except Exception as e:
+				self._load_error = e
+				if self.logger: self.logger.error("Failed to load embedding model: %s", e)
+			finally:
+				self._ready.set()
+
+	@property
+	def model(self):
+			self.warm_up()
+			self._ready.wait()
+			if self._load_error is not None:
+				raise RuntimeError("Embedding model failed to load") from self._load_error
+			return self._model
+
+	def _encode(self, texts):
 			return self.model.encode(
-					text, normalize_embeddings=True,
-					device='cuda', batch_size=64, show_progress_bar=False
+					texts, normalize_embeddings=True,
+					device=self.device, batch_size=64, show_progress_bar=False
 			)
 
+	def embed(self, text):
+			# Wait for warm-up first so model loading is not counted as embedding time.
+			self.model
+			with tracer.span("embed"):
+				if self.batcher is not None and isinstance(text, str):
+					return self.batcher.embed(text)
+				return self._encode(text)
+
 	def extract_query_info(self, query, previous_chat=None, conversation_focus=None):
 			"""
 			Extracts relevant information from the user query.
 			"""
-			if config.get('skip_reformatting', False):
-					return self._extract_query_info_without_reformatting(query, conversation_focus)
+			if self.config.get('skip_reformatting', False):
+					return self._extract_query_info_without_reformatting(query)
 			else:
 					return self._extract_query_info_with_reformatting(query, previous_chat, conversation_focus)
 	def _extract_query_info_with_reformatting(self, query, previous_chat=None, conversation_focus=None):
@@ -72,14 +134,16 @@ class LLMEmbedder:
 					}}
 			}}
 			"""
-			if self.logger: self.logger.info(f"Reformulator System Prompt: {system_prompt}")
-			if self.logger: self.logger.info(f"Reformulator User Query: {query}")
-			response = self.engine.generate_response({
-				"system_query": system_prompt,
-				"user_query": query,
-				"max_tokens": 100,
-				"temperature": 0.0
-			})
+			tracer.payload("Reformulator System Prompt", system_prompt)
+			tracer.payload("Reformulator User Query", query)
+			with tracer.span("rewrite"):
+				response = self.engine.generate_response({
+					"system_query": system_prompt,
+					"user_query": query,
+					"max_tokens": 100,
+					"temperature": 0.0,
+					"priority": PRIORITY_REWRITE
+				})
 
 			if response:
 				return json.loads(response)
@@ -91,7 +155,7 @@ class LLMEmbedder:
 			}
     
 	def get_query_text(self, query_text):
-		if config['prepend_chunks_and_queries']:
+		if self.config['prepend_chunks_and_queries']:
 			return f"Represent this sentence for searching relevant passages: {query_text}"
 		else: 
 			return query_text
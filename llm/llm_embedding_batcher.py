@@ -0,0 +1,89 @@
+# ----- SETUP -----
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from llm.llm_tracing import metrics
+# -----------------
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class EmbeddingBatcher:
+    def __init__(self, encode, max_batch_size=32, max_wait_ms=5.0):
+        """
+        Collects concurrent single-text embedding requests and encodes them together.
+        A batch is closed `max_wait_ms` after its first request arrived, or as soon as it holds
+        `max_batch_size` texts. `encode(texts)` must return one vector per text, in order.
+        """
+        self.encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.requests = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+        self.queue_depth = metrics.gauge("rag_embedding_queue_depth", "Embedding requests waiting for a batch.")
+        self.batch_sizes = metrics.histogram(
+            "rag_embedding_batch_size", "Number of texts encoded per model call.", BATCH_SIZE_BUCKETS
+        )
+        self.queue_seconds = metrics.histogram(
+            "rag_embedding_queue_seconds", "Time an embedding request waited before its batch was encoded."
+        )
+
+    def embed(self, text):
+        """
+        Embed one text, blocking until the batch it joined has been encoded.
+        """
+        self._ensure_worker()
+        future = Future()
+        self.queue_depth.inc()
+        self.requests.put((text, future, time.perf_counter()))
+        return future.result()
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+
+    def _next_batch(self):
+        batch = [self.requests.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self.requests.get(timeout=remaining) if remaining > 0 else self.requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            self.queue_depth.inc(-len(batch))
+            self.batch_sizes.observe(len(batch))
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self.queue_seconds.observe(started - enqueued)
+            try:
+                vectors = self.encode([text for text, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def stats(self):
+        """
+        Current queue depth and the batch-size distribution so far (cumulative buckets, as exported).
+        """
+        series = self.batch_sizes.values.get((), [0] * len(BATCH_SIZE_BUCKETS) + [0.0, 0])
+        return {
+            "queue_depth": self.queue_depth.get(),
+            "batches": series[-1],
+            "mean_batch_size": series[-2] / series[-1] if series[-1] else 0.0,
+            "batch_size_buckets": dict(zip(BATCH_SIZE_BUCKETS, series)),
+        }
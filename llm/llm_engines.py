@@ -1,20 +1,39 @@
 # ----- SETUP -----
 from abc import abstractmethod
-from groq import Groq
 import os
 import dotenv
 
 dotenv.load_dotenv()
 
-from google import genai
-from google.genai import types
+from llm.llm_scheduler import PRIORITY_ANSWER, get_scheduler
+from llm.llm_tracing import tracer
+from utils.tokens import estimate_tokens
 # -----------------
 
 class LLMEngine:
-    def __init__(self, model_name: str, defaults=None):
+    def __init__(self, model_name: str, defaults=None, scheduler=None):
         self.model_name = model_name
         self.temperature = defaults.get("temperature", 0.0) if defaults else 0.0
         self.max_tokens = defaults.get("max_tokens", 500) if defaults else 500
+        self.scheduler = scheduler
+
+    def _schedule(self, params: dict, call, usage=None):
+        """
+        Run a provider call through the shared rate-limit scheduler, if one is configured.
+        The reservation covers the prompt plus the maximum completion length.
+        """
+        if self.scheduler is None:
+            return call()
+        estimated_tokens = (
+            estimate_tokens(params.get("system_query", "")) +
+            estimate_tokens(params.get("user_query", "")) +
+            params.get("max_tokens", self.max_tokens)
+        )
+        return self.scheduler.run(
+            call, estimated_tokens,
+            priority=params.get("priority", PRIORITY_ANSWER),
+            usage=usage
+        )
 
     @abstractmethod
     def generate_response(self, params: dict) -> str:
@@ -22,15 +41,21 @@ class LLMEngine:
         pass
 
 class GroqLLMEngine(LLMEngine):
-    def __init__(self, model_name: str, defaults=None):
+    def __init__(self, model_name: str, defaults=None, scheduler=None):
         """
         Initialize the Groq LLM engine with the model name and default parameters.
         """
-        super().__init__(model_name, defaults)
-        self.groq_client = Groq(api_key=os.getenv("GROQ_KEY"))
+        super().__init__(model_name, defaults, scheduler)
+        # Provider SDKs are imported on use so only the configured one is ever loaded.
+        from groq import Groq
+        # Retries are owned by the scheduler so that backoff is coordinated across sessions.
+        self.groq_client = Groq(
+            api_key=os.getenv("GROQ_KEY"),
+            max_retries=0 if scheduler else 2
+        )
 
     def generate_response(self, params: dict) -> str:
-        response = self.groq_client.chat.completions.create(
+        response = self._schedule(params, lambda: self.groq_client.chat.completions.create(
             model=self.model_name,
             messages=[
                 {"role": "system", "content": params.get("system_query", "")},
@@ -38,39 +63,56 @@ class GroqLLMEngine(LLMEngine):
             ],
             max_tokens=params.get("max_tokens", self.max_tokens),
             temperature=params.get("temperature", self.temperature)
-        )
+        ), usage=lambda r: r.usage.total_tokens)
+        if response.usage:
+            tracer.record_tokens(self.model_name, response.usage.prompt_tokens, response.usage.completion_tokens)
         return response.choices[0].message.content.strip()
 
 class GoogleLLMEngine(LLMEngine):
-    def __init__(self, model_name: str, defaults=None):
-        super().__init__(model_name, defaults)
+    def __init__(self, model_name: str, defaults=None, scheduler=None):
+        super().__init__(model_name, defaults, scheduler)
+        from google import genai
+        from google.genai import types
+        self.types = types
         self.google_client = genai.Client(
           api_key=os.getenv("GEMINI_API_KEY"),
         )
 
     def generate_response(self, params: dict) -> str:
-        response = self.google_client.models.generate_content(
+        response = self._schedule(params, lambda: self.google_client.models.generate_content(
           model=self.model_name,
-          contents="",
-          config=types.GenerateContentConfig(
+          contents=params.get("user_query", ""),
+          config=self.types.GenerateContentConfig(
               temperature=params.get("temperature", self.temperature),
-              max_tokens=params.get("max_tokens", self.max_tokens),
+              max_output_tokens=params.get("max_tokens", self.max_tokens),
               system_instruction= params.get("system_query", ""),
-              thinking_config=types.ThinkingConfig(
+              thinking_config=self.types.ThinkingConfig(
                   thinking_budget=0
               )
           )
-        )
-        return response.candidates[0].content.strip()
+        ), usage=lambda r: r.usage_metadata.total_token_count)
+        if response.usage_metadata:
+            tracer.record_tokens(self.model_name, response.usage_metadata.prompt_token_count, response.usage_metadata.candidates_token_count)
+        return response.text.strip()
 
 
-def get_engine(platform: str, model_name: str, defaults: dict = None):
+def get_engine(platform: str, model_name: str, defaults: dict = None, rate_limits: dict = None, routing: dict = None):
     """
     Factory function to get the appropriate LLM engine based on the model name.
+    Engines on the same platform share one rate-limit scheduler.
     """
+    if platform == "router":
+        from llm.llm_router import RoutingLLMEngine
+        engines = [
+            get_engine(route['platform'], route['model_name'], route.get('defaults', defaults), route.get('rate_limits'))
+            for route in routing['engines']
+        ]
+        settings = {key: value for key, value in routing.items() if key != 'engines'}
+        return RoutingLLMEngine(engines, defaults=defaults, **settings)
+    scheduler = get_scheduler(platform, rate_limits)
     if platform == "groq":
-        return GroqLLMEngine(model_name)
+        return GroqLLMEngine(model_name, defaults, scheduler)
     elif platform == "google":
-        return GoogleLLMEngine(model_name)
+        return GoogleLLMEngine(model_name, defaults, scheduler)
     else:
         raise ValueError(f"Unknown model name: {model_name}")
\ No newline at end of file
@@ -1,55 +1,234 @@
 import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-import chromadb
 from chat.chat_history import ChatHistory
 from llm.llm_embedder import LLMEmbedder
+from llm.llm_tracing import tracer
+from utils.tokens import estimate_tokens
 
 # --- SETUP ---
-client = chromadb.PersistentClient(
-    path="chroma_db",
-)
+_client = None
+_client_lock = threading.Lock()
 # ----------------
 
+def get_client():
+	"""
+	The Chroma client is opened on first use rather than at import time.
+	"""
+	global _client
+	with _client_lock:
+		if _client is None:
+			import chromadb
+			_client = chromadb.PersistentClient(
+				path="chroma_db",
+			)
+		return _client
+
 class KnowledgeBase:
 	def __init__(self, embedder: LLMEmbedder, chat_history: ChatHistory, config: dict,  logger=None):
 		self.config = config
 		self.embedder = embedder
 		self.chat_history = chat_history
-		self.collection = client.get_collection(
-			name=f"rag_etg_{config['embedding_model']['collection_name']}"
-		)
+		self._collection = None
+		self._collection_lock = threading.Lock()
 		self.logger = logger
+		prefetch_config = config['retrieval_settings'].get('prefetch', {})
+		self.prefetch_executor = None
+		if prefetch_config.get('enabled', False):
+			self.prefetch_executor = ThreadPoolExecutor(
+				max_workers=prefetch_config.get('workers', 2), thread_name_prefix="section-prefetch"
+			)
+		self._link_graph = None
+		self._link_graph_lock = threading.Lock()
+
+	@property
+	def collection(self):
+		"""
+		The vector index: the Chroma collection, or the compact quantized index when
+		retrieval_settings.index is "quantized". Both answer the same query() calls.
+		"""
+		if self._collection is not None:
+			return self._collection
+		# warm_up and the first query may both get here; only one of them opens the index.
+		with self._collection_lock:
+			if self._collection is None:
+				if self.config['retrieval_settings'].get('index', 'chroma') == 'quantized':
+					from llm.llm_quantized_index import QuantizedIndex
+					index_config = self.config['retrieval_settings'].get('quantized_index', {})
+					self._collection = QuantizedIndex.load(
+						self._quantized_index_path(),
+						first_stage=index_config.get('first_stage', "binary"),
+						candidate_multiplier=index_config.get('candidate_multiplier', 10)
+					)
+				else:
+					self._collection = get_client().get_collection(
+						name=f"rag_etg_{self.config['embedding_model']['collection_name']}"
+					)
+		return self._collection
+
+	def _quantized_index_path(self):
+		index_config = self.config['retrieval_settings'].get('quantized_index', {})
+		return os.path.join(index_config.get('path', "quantized_index"), self.config['embedding_model']['collection_name'])
+
+	def index_fingerprint(self):
+		"""
+		Identifies the indexed data, so caches built on top of it can tell when it was re-indexed.
+		embed_and_vectorize recreates the collection, which changes its id and indexed_at marker.
+		"""
+		if self.config['retrieval_settings'].get('index', 'chroma') == 'quantized':
+			return os.stat(os.path.join(self._quantized_index_path(), "chunks.json")).st_mtime_ns
+		collection = get_client().get_collection(
+			name=f"rag_etg_{self.config['embedding_model']['collection_name']}"
+		)
+		return (str(collection.id), (collection.metadata or {}).get('indexed_at'), collection.count())
+
+	def warm_up(self):
+		"""
+		Open the Chroma collection on a background thread so the first query does not pay for it.
+		"""
+		def open_collection():
+			try:
+				self.collection
+			except Exception as e:
+				if self.logger: self.logger.error("Failed to open collection: %s", e)
+		threading.Thread(target=open_collection, name="knowledge-base-warm-up", daemon=True).start()
 
 	def embed(self, text):
 		return self.embedder.embed(text)
 
-	def query(self, query, conversation_focus=None):
+	def query(self, query, conversation_focus=None, chat_history=None):
 		"""
 		Process the user query to extract relevant information and retrieve context.
+		`chat_history` is the conversation being answered, defaulting to the one given at construction.
+		After a vector lookup, query_info also carries the query `embedding`, the retrieved `chunk_ids` and the
+		`linked_context` pages found through the link graph. Those only feed the current answer, so they are
+		kept out of context_array, which is what ends up in the session history.
 		"""
-		query_info = self.embedder.extract_query_info(query, self.chat_history.get_chat(), conversation_focus)
-		if self.logger: self.logger.info(f"Query Info: {json.dumps(query_info, indent=2)}")
+		if chat_history is None:
+			chat_history = self.chat_history
+		query_info = self.embedder.extract_query_info(query, chat_history.get_chat() if chat_history else None, conversation_focus)
+		tracer.payload("Query Info", json.dumps, query_info, indent=2)
+
+		# Follow-ups usually stay on the same page: serve a prefetched sibling section without touching the index.
+		prefetched = self._lookup_prefetched(query_info, chat_history)
+		if prefetched is not None:
+			if self.logger: self.logger.info("Serving prefetched section for query: %s", query_info['query'])
+			if prefetched in chat_history.context_history:
+				return query_info, None
+			return query_info, [prefetched]
   
 		# Check if the query has enough context to skip lookup, avoids bloating context with unnecessary information.
-		if self.check_if_in_context(query_info['query']):
+		in_context = self.check_if_in_context(query_info['query'], chat_history)
+		tracer.record_cache("context", in_context)
+		if in_context:
 			if self.logger: self.logger.info("Query has enough context, skipping lookup.")
 			return query_info, None
   
 		# Query the ChromaDB collection
 		context_raw = self._query(query_info)
 		context_array = [doc['document'] for doc in context_raw]
-		if self.logger: self.logger.info(f"Context Array: {context_array}")
-		if not context_array:
-			return "Not enough information in the context to answer this question."
-
+		query_info['chunk_ids'] = [doc['metadata'].get('id') for doc in context_raw]
+		query_info['linked_context'] = self.expand_with_links(context_raw, chat_history)
+		tracer.payload("Context Array", context_array)
+		tracer.payload("Linked Context", query_info['linked_context'])
+		# Runs while the answer is being generated.
+		for doc in context_raw:
+			self.prefetch_siblings(doc['metadata'].get('title'), chat_history)
 		return query_info, context_array
 
+	@property
+	def link_graph(self):
+		"""
+		Chunk id -> linked page titles, built by prepare_data. Empty if expansion is off or the file is missing.
+		"""
+		with self._link_graph_lock:
+			if self._link_graph is None:
+				expansion_config = self.config['retrieval_settings'].get('link_expansion', {})
+				self._link_graph = {}
+				if expansion_config.get('enabled', False):
+					path = expansion_config.get('path', "data/link_graph.json")
+					try:
+						with open(path, "r", encoding="utf-8") as f:
+							self._link_graph = json.load(f)
+					except FileNotFoundError:
+						if self.logger: self.logger.warning("Link graph %s not found, link expansion disabled. Rerun python -m data.prepare_data to build it.", path)
+			return self._link_graph
+
+	def expand_with_links(self, context_raw, chat_history=None):
+		"""
+		One-hop expansion of retrieved chunks through the wiki link graph.
+		Neighbour pages are fetched by chunk id (`Title:Section`, first available of the configured
+		sections), so no extra embedding or vector search is needed. Stops at the token budget.
+		"""
+		if not context_raw or not self.link_graph:
+			return []
+		expansion_config = self.config['retrieval_settings'].get('link_expansion', {})
+		sections = expansion_config.get('sections', ["Effects", "Summary"])
+		max_neighbours = expansion_config.get('max_neighbours', 2)
+		retrieved_titles = {doc['metadata'].get('title') for doc in context_raw}
+		neighbours = []
+		for doc in context_raw:
+			linked = [t for t in self.link_graph.get(doc['metadata'].get('id'), []) if t not in retrieved_titles]
+			for title in linked[:max_neighbours]:
+				if title not in neighbours:
+					neighbours.append(title)
+		if not neighbours:
+			return []
+
+		with tracer.span("link_expansion"):
+			results = self.collection.get(ids=[f"{title}:{section}" for title in neighbours for section in sections])
+		documents = dict(zip(results['ids'], results['documents']))
+		budget = expansion_config.get('token_budget', 600)
+		known = set(chat_history.context_history) if chat_history else set()
+		expanded = []
+		for title in neighbours:
+			document = next((documents[f"{title}:{section}"] for section in sections if f"{title}:{section}" in documents), None)
+			if document is None or document in known:
+				continue
+			tokens = estimate_tokens(document)
+			if tokens > budget:
+				continue
+			budget -= tokens
+			expanded.append(document)
+		if self.logger: self.logger.info("Link expansion added %d of %d neighbour pages", len(expanded), len(neighbours))
+		return expanded
+
+	def _lookup_prefetched(self, query_info, chat_history):
+		if self.prefetch_executor is None or not chat_history or "metadata" not in query_info:
+			return None
+		document = chat_history.lookup_prefetched(
+			query_info["metadata"].get("item"), query_info["metadata"].get("section")
+		)
+		tracer.record_cache("prefetch", document is not None)
+		return document
+
+	def prefetch_siblings(self, title, chat_history):
+		"""
+		Fetch every section of `title` in the background into the session's prefetch cache.
+		Chunk ids are `Title:Section`, so this is a metadata lookup, not a vector search.
+		"""
+		if self.prefetch_executor is None or not chat_history or not title or chat_history.has_prefetched(title):
+			return
+		def fetch():
+			try:
+				with tracer.span("prefetch"):
+					results = self.collection.get(where={"title": title})
+				chat_history.store_prefetched(title, {
+					meta['section']: document for document, meta in zip(results['documents'], results['metadatas'])
+				})
+			except Exception as e:
+				if self.logger: self.logger.error("Failed to prefetch sections of %s: %s", title, e)
+		self.prefetch_executor.submit(fetch)
+
 	def _query(self, query_info):
 			"""
 			Looks up the reformulated query in the ChromaDB collection.
 			"""
 			query_text = self.embedder.get_query_text(query_info['query'])
 			emb = self.embedder.embed(query_text)
+			query_info['embedding'] = emb
 			if not self.config.get('skip_reformatting', False) and "metadata" in query_info:
 				where_clause = {
 					"section": query_info["metadata"]["section"],
@@ -60,15 +239,16 @@ class KnowledgeBase:
 				}
 			else:
 				where_clause = None
-			results = self.collection.query(
-				query_embeddings=[emb],
-				n_results=self.config['retrieval_settings']['top_k'],
-				where=where_clause
-			)
+			with tracer.span("vector_query"):
+				results = self.collection.query(
+					query_embeddings=[emb],
+					n_results=self.config['retrieval_settings']['top_k'],
+					where=where_clause
+				)
 
 			if self.logger: 
 				for id, distance in zip(results['ids'][0], results['distances'][0]):
-					self.logger.info(f"ID: {id}, Distance: {distance}")
+					self.logger.info("ID: %s, Distance: %s", id, distance)
 
 			threshold = self.config['retrieval_settings']['similarity_threshold']
 			if threshold is not None:
@@ -84,34 +264,38 @@ class KnowledgeBase:
 				return filtered_docs
 			return results
 	def _query_forced(self, query_info, conversation_focus=None):
-		if self.logger: self.logger.info(f"Forced lookup for query: {query_info['query']}")
+		if self.logger: self.logger.info("Forced lookup for query: %s", query_info['query'])
 		context_raw = self._query(query_info)
 		context_array = [doc['document'] for doc in context_raw]
-		if self.logger: self.logger.info(f"Context Array: {context_array}")
-		if not context_array:
-			return "Not enough information in the context to answer this question."
+		tracer.payload("Context Array", context_array)
 		return query_info, context_array
   
   
-	def check_if_in_context(self, reformulated_query):
+	def check_if_in_context(self, reformulated_query, chat_history=None):
 		"""
 		Check if the query has enough context to skip lookup, avoids bloating context with unnecessary information.
 		"""
-		if self.logger: self.logger.info(f"Checking if context is enough for query: {reformulated_query}, current context length: {len(self.chat_history.context_history)}")
-		if not self.chat_history: return False
-		if not len(self.chat_history.context_history):
+		if chat_history is None:
+			chat_history = self.chat_history
+		if not chat_history: return False
+		if self.logger: self.logger.info("Checking if context is enough for query: %s, current context length: %d", reformulated_query, len(chat_history.context_history))
+		if not len(chat_history.context_history):
 			if self.logger: self.logger.info("No context available, lookup is necessary.")
 			return False
   
-		scores = [
-			self._cosine_distance(self.embed(reformulated_query), self.embed(item)) for item in self.chat_history.context_history
-		]
+		with tracer.span("context_check"):
+			# One call for all context items: a list goes straight to the model instead of through the batcher.
+			query_embedding = self.embed(reformulated_query)
+			context_embeddings = self.embed(list(chat_history.context_history))
+			scores = [
+				self._cosine_distance(query_embedding, item_embedding) for item_embedding in context_embeddings
+			]
 		if self.logger: 
-			self.logger.info(f"Context Scores: ")
-			for i, item in enumerate(self.chat_history.context_history):
-				self.logger.info(f"Item: {item[:50]}, Score: {scores[i]}")
+			self.logger.info("Context Scores: ")
+			for i, item in enumerate(chat_history.context_history):
+				self.logger.info("Item: %s, Score: %s", item[:50], scores[i])
 		has_enough_context = any(score < self.config['chat_history']['lookup_score_threshold'] for score in scores)
-		if self.logger: self.logger.info(f"Has enough context: {has_enough_context}")
+		if self.logger: self.logger.info("Has enough context: %s", has_enough_context)
 		return has_enough_context
 
 	def _cosine_distance(self, vec1, vec2):
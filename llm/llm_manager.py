@@ -1,20 +1,26 @@
-import json
+from llm.llm_answer_cache import AnswerCache
 from llm.llm_embedder import LLMEmbedder
 from llm.llm_knowledge_base import KnowledgeBase
 from llm.llm_engines import get_engine
+from llm.llm_scheduler import PRIORITY_REWRITE
+from llm.llm_tracing import tracer
 from chat.chat_history import ChatHistory
 import logging
 import datetime
 import os
+import time
 
 # --- SETUP ---
-with open("config.json", "r") as f:
-    config = json.load(f)
+ERROR_RESPONSE = "An error occurred while processing your query. Please try again later."
+UNANSWERED_RESPONSES = ["I don't know", "Not enough information in the context to answer this question."]
 # ----------------
 
 class LLMManager:
     def __init__(self, config, persistent=False, log_dir=None):
         self.config = config
+        self.logger = None
+        self.log_dir = log_dir
+        tracer.configure(config.get('tracing'))
         if log_dir:
             log_dir = os.path.join(log_dir, "llm_manager")
             self.logger = True
@@ -26,60 +32,137 @@ class LLMManager:
         
         self.persistent = persistent
         if self.persistent:
-            self.chat_history = ChatHistory(
-                chat_limit=config['chat_history']['chat_limit'],
-                context_limit=config['chat_history']['context_limit']
-            )
+            self.chat_history = self.new_chat_history()
         else: self.chat_history = None
         self.engine = get_engine(
             config['llm_engine']['platform'], 
             config['llm_engine']['model_name'], 
-            config['llm_engine']['defaults']
+            config['llm_engine']['defaults'],
+            config['llm_engine'].get('rate_limits'),
+            self._routing_settings()
         )
         self.embedder = LLMEmbedder(self.engine, config, logging)
         self.knowledge_base = KnowledgeBase(self.embedder, self.chat_history, config, logging)
+        # The embedder is already loading its model in the background; open the index alongside it.
+        self.knowledge_base.warm_up()
+        cache_config = config['retrieval_settings'].get('answer_cache', {})
+        self.answer_cache = None
+        if cache_config.get('enabled', False):
+            self.answer_cache = AnswerCache(
+                fingerprint=self.knowledge_base.index_fingerprint,
+                similarity_threshold=cache_config.get('similarity_threshold', 0.95),
+                max_entries=cache_config.get('max_entries', 512),
+                check_interval=cache_config.get('check_interval', 30),
+                logger=logging if self.logger else None
+            )
+
+
+    def _routing_settings(self):
+        """
+        Routing config with the router's worker pool sized for the configured concurrency, unless
+        routing.max_workers is set explicitly.
+        """
+        routing = self.config['llm_engine'].get('routing')
+        if not routing or 'max_workers' in routing:
+            return routing
+        concurrency = max(
+            self.config.get('server', {}).get('max_concurrent', 8),
+            self.config.get('batch', {}).get('workers', 4)
+        )
+        # Each query has one call in flight at a time, and each call may add `max_hedges` hedges.
+        # The extra workers leave room for background summaries and losing hedges that are still running.
+        workers = concurrency * (routing.get('max_hedges', 1) + 1) + 4
+        return {**routing, 'max_workers': workers}
 
+    def new_chat_history(self):
+        """
+        A fresh chat history using the configured limits, one per conversation.
+        """
+        history_config = self.config['chat_history']
+        return ChatHistory(
+            chat_limit=history_config['chat_limit'],
+            context_limit=history_config['context_limit'],
+            chat_token_limit=history_config.get('chat_token_limit'),
+            context_token_limit=history_config.get('context_token_limit'),
+            summarizer=self._summarize_turns if history_config.get('summarize_evicted', True) else None,
+            summary_token_limit=history_config.get('summary_token_limit', 200),
+            summary_batch_messages=history_config.get('summary_batch_messages', 4),
+            summary_batch_tokens=history_config.get('summary_batch_tokens'),
+            prefetch_limit=self.config['retrieval_settings'].get('prefetch', {}).get('max_items', 4),
+            logger=logging if self.logger else None
+        )
 
     def embed(self, text):
         return self.embedder.embed(text)
       
-    def query(self, query):
+    def query(self, query, chat_history=None, profile_path=None, use_answer_cache=True):
         """
         Process the user query to extract relevant information and retrieve context, and combine it with previous context
+        `chat_history` selects the conversation to answer in (e.g. a server session), defaulting to the
+        manager's own history in persistent mode and to a stateless query otherwise.
+        If `profile_path` is given, the query runs under cProfile and the stats are written there.
+        `use_answer_cache=False` always generates a fresh answer, e.g. for regression runs.
         """
-        try:            
+        if chat_history is None:
+            chat_history = self.chat_history
+        if profile_path:
+            with tracer.profile(profile_path):
+                return self._traced_query(query, chat_history, use_answer_cache)
+        return self._traced_query(query, chat_history, use_answer_cache)
+
+    def _traced_query(self, query, chat_history, use_answer_cache=True):
+        with tracer.trace():
+            return self._run_query(query, chat_history, use_answer_cache)
+
+    def _run_query(self, query, chat_history, use_answer_cache=True):
+        try:
             # Although I'd rather add all three at the same time, focus does consider the current query in its decision
-            if self.persistent:
-                self.chat_history.inqueue_message("user", query)
-            conversation_focus = self._get_conversation_focus()
+            if chat_history:
+                chat_history.inqueue_message("user", query)
+            conversation_focus = self._get_conversation_focus(chat_history)
             
             additional_context = None
-            if self.persistent:
-                additional_context = str(self.chat_history)
-            query_info, context_array = self.knowledge_base.query(query, conversation_focus)
+            if chat_history:
+                additional_context = str(chat_history)
+            query_info, context_array = self.knowledge_base.query(query, conversation_focus, chat_history)
 
+            # Stateless questions are answered from the retrieved chunks alone, so a paraphrase that
+            # retrieved the same chunks can reuse an earlier answer.
+            use_cache = (
+                use_answer_cache and self.answer_cache is not None and chat_history is None and
+                context_array and 'embedding' in query_info
+            )
+            if use_cache:
+                answer = self.answer_cache.lookup(query_info['embedding'], query_info['chunk_ids'])
+                if answer is not None:
+                    return answer
+            started = time.perf_counter()
+            # Linked pages are added to this prompt only; the history keeps just the retrieved chunks.
+            prompt_context = (context_array or []) + query_info.get('linked_context', [])
             answer = self._query(query_info['query'], 
-                context_array=context_array, 
+                context_array=prompt_context or None, 
                 additional_context=additional_context,
                 conversation_focus=conversation_focus
             )
             # If the LLM response is not satisfactory and the query was believed to have enough context, request additional context.
-            if answer in ["I don't know", "Not enough information in the context to answer this question."] and not context_array:
+            if answer in UNANSWERED_RESPONSES and context_array is None:
                 if self.logger: logging.info("Although the query was believed to have enough context, the LLM could not answer it. Requesting additional context via lookup.")
-                context_array = self.knowledge_base._query_forced(query, conversation_focus)
+                _, context_array = self.knowledge_base._query_forced(query_info, conversation_focus)
                 answer = self._query(query_info['query'], 
                     context_array=context_array, 
                     additional_context=additional_context,
                     conversation_focus=conversation_focus
                 )
-                
-            if self.persistent:
-                if context_array: self.chat_history.inqueue_context(context_array)
-                self.chat_history.inqueue_message("assistant", answer)
+
+            if use_cache and answer and answer not in UNANSWERED_RESPONSES:
+                self.answer_cache.store(query_info['embedding'], query_info['chunk_ids'], answer, time.perf_counter() - started)
+            if chat_history:
+                if context_array: chat_history.inqueue_context(context_array)
+                chat_history.inqueue_message("assistant", answer)
             return answer
         except Exception as e:
-            logging.error(f"Error in LLMManager query: {e}")
-            return "An error occurred while processing your query. Please try again later."
+            logging.error("Error in LLMManager query: %s", e)
+            return ERROR_RESPONSE
 
     def _query(self, query, context_array=None, additional_context=None, conversation_focus=None):
         """
@@ -95,40 +178,69 @@ class LLMManager:
 
         {conversation_focus if conversation_focus else ""}
         """
-        logging.info(f"System Prompt: {system_prompt}")
-        logging.info(f"User Query: {query}")
-        
-        response = self.engine.generate_response({
-            "system_query": system_prompt,
-            "user_query": query,
-            "max_tokens": self.config['llm_engine']['defaults'].get('max_tokens', 500),
-            "temperature": self.config['llm_engine']['defaults'].get('temperature', 0.0)
-        })
-        if self.logger: logging.info(f"LLM Response: {response}")
+        tracer.payload("System Prompt", system_prompt)
+        tracer.payload("User Query", query)
+
+        with tracer.span("answer"):
+            response = self.engine.generate_response({
+                "system_query": system_prompt,
+                "user_query": query,
+                "max_tokens": self.config['llm_engine']['defaults'].get('max_tokens', 500),
+                "temperature": self.config['llm_engine']['defaults'].get('temperature', 0.0)
+            })
+        tracer.payload("LLM Response", response)
         return response
 
-    def _get_conversation_focus(self):
+    def _get_conversation_focus(self, chat_history):
         """
         Get the conversation focus based on the chat history.
         """
-        if not self.persistent or not len(self.chat_history.message_history):
+        if not chat_history or not len(chat_history.message_history):
             return None
-        conversation = '\n'.join([f"{m['role']}: {m['text']}" for m in self.chat_history.message_history])
-        if self.logger: logging.info(f"Current Conversation: {conversation}")
+        conversation = chat_history.get_chat()
+        tracer.payload("Current Conversation", conversation)
         
         system_prompt = f"""
         You are an expert on the video game "Enter the Gungeon". Based on the conversation below, Determine the main object of focus for the conversation, which may be referred to as "it" or "that". If there is no clear focus, return None.
         """
         user_query = f"Conversation: {conversation}\nWhat is the main object of focus for the conversation?"
-        if self.logger: logging.info(f"System Prompt: {system_prompt}")
-        if self.logger: logging.info(f"User Query: {user_query}")
-        response = self.engine.generate_response({
-            "system_query": system_prompt,
-            "user_query": user_query,
-            "max_tokens": 100,
-            "temperature": 0.0
-        })
+        tracer.payload("Focus System Prompt", system_prompt)
+        tracer.payload("Focus User Query", user_query)
+        with tracer.span("focus"):
+            response = self.engine.generate_response({
+                "system_query": system_prompt,
+                "user_query": user_query,
+                "max_tokens": 100,
+                "temperature": 0.0,
+                "priority": PRIORITY_REWRITE
+            })
         if response:
-            if self.logger: logging.info(f"Conversation Focus: {response}")
+            tracer.payload("Conversation Focus", response)
             return response
-        return None
\ No newline at end of file
+        return None
+
+    def _summarize_turns(self, previous_summary, messages):
+        """
+        Fold messages evicted from a chat history into its rolling summary.
+        Runs on the history's background worker, never on the request path.
+        """
+        summary_limit = self.config['chat_history'].get('summary_token_limit', 200)
+        system_prompt = f"""
+        You maintain a running summary of a conversation about the video game "Enter the Gungeon". Merge the earlier summary with the new messages into one concise summary of at most {summary_limit} tokens. Keep the items, enemies and facts the user asked about, drop pleasantries.
+        """
+        new_messages = "\n".join(f"{m['role']}: {m['text']}" for m in messages)
+        user_query = f"Earlier summary: {previous_summary or 'None'}\nNew messages:\n{new_messages}"
+        with tracer.span("summary"):
+            return self.engine.generate_response({
+                "system_query": system_prompt,
+                "user_query": user_query,
+                "max_tokens": summary_limit,
+                "temperature": 0.0,
+                "priority": PRIORITY_REWRITE
+            })
+
+    def export_metrics(self):
+        """
+        Stage timings, token and cache counters (including answer cache hits and time saved) in the Prometheus text format.
+        """
+        return tracer.metrics.export_text()
@@ -0,0 +1,193 @@
+# ----- SETUP -----
+import json
+import os
+
+import numpy as np
+# -----------------
+
+# Popcount of every byte value, used when numpy has no bitwise_count (numpy < 2.0).
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(packed):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(packed)
+    return _POPCOUNT[packed]
+
+
+def _top(scores, k, largest=True):
+    """
+    Indices of the k best scores, best first, without sorting the whole array.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    keyed = -scores if largest else scores
+    part = np.argpartition(keyed, k - 1)[:k]
+    return part[np.argsort(keyed[part], kind="stable")]
+
+
+class QuantizedIndex:
+    def __init__(self, ids, metadatas, documents, binary, int8, scale, vectors,
+                 first_stage="binary", candidate_multiplier=10):
+        """
+        Compact two-stage index over normalized embeddings.
+        The first stage scans 1-bit codes (Hamming distance) or int8 codes (integer dot product)
+        to shortlist `candidate_multiplier * n_results` chunks, which are then rescored with the
+        original float32 vectors. The float vectors are memory-mapped, so only shortlisted rows
+        are ever read into memory.
+        """
+        self.ids = ids
+        self.metadatas = metadatas
+        self.documents = documents
+        self.binary = binary
+        self.int8 = int8
+        self.scale = scale
+        self.vectors = vectors
+        self.first_stage = first_stage
+        self.candidate_multiplier = candidate_multiplier
+        self.positions = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        # field -> value -> row indices, so filters cost a lookup instead of a scan, and no
+        # per-filter cache grows with the rewritten sections and titles seen at query time.
+        rows_by_value = {}
+        for i, meta in enumerate(metadatas):
+            for field, value in meta.items():
+                rows_by_value.setdefault(field, {}).setdefault(value, []).append(i)
+        self.rows_by_value = {
+            field: {value: np.array(rows, dtype=np.int64) for value, rows in values.items()}
+            for field, values in rows_by_value.items()
+        }
+
+    @classmethod
+    def build(cls, ids, embeddings, metadatas, documents, **kwargs):
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        binary = np.packbits(vectors > 0, axis=1)
+        # Symmetric per-dimension scale, so every dimension uses the full int8 range.
+        scale = np.abs(vectors).max(axis=0) / 127.0
+        scale[scale == 0] = 1.0
+        int8 = np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8)
+        return cls(list(ids), list(metadatas), list(documents), binary, int8, scale.astype(np.float32), vectors, **kwargs)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "binary.npy"), self.binary)
+        np.save(os.path.join(path, "int8.npy"), self.int8)
+        np.save(os.path.join(path, "scale.npy"), self.scale)
+        np.save(os.path.join(path, "float32.npy"), self.vectors)
+        with open(os.path.join(path, "chunks.json"), "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "metadatas": self.metadatas, "documents": self.documents}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path, mmap=True, **kwargs):
+        with open(os.path.join(path, "chunks.json"), "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        return cls(
+            chunks["ids"], chunks["metadatas"], chunks["documents"],
+            np.load(os.path.join(path, "binary.npy")),
+            np.load(os.path.join(path, "int8.npy")),
+            np.load(os.path.join(path, "scale.npy")),
+            np.load(os.path.join(path, "float32.npy"), mmap_mode="r" if mmap else None),
+            **kwargs
+        )
+
+    def memory_usage(self):
+        """
+        Bytes held by each representation of the vectors.
+        """
+        return {
+            "binary": self.binary.nbytes,
+            "int8": self.int8.nbytes + self.scale.nbytes,
+            "float32": self.vectors.size * self.vectors.itemsize,
+        }
+
+    def _mask(self, where):
+        """
+        Row indices matching a Chroma-style equality filter ({"field": value} or {"$and": [...]}).
+        """
+        if not where:
+            return None
+        conditions = where["$and"] if "$and" in where else [{field: value} for field, value in where.items()]
+        rows = None
+        for condition in conditions:
+            for field, value in condition.items():
+                if isinstance(value, dict):
+                    raise ValueError(f"Unsupported filter operator in {condition}")
+                matching = self.rows_by_value.get(field, {}).get(value)
+                if matching is None:
+                    return np.empty(0, dtype=np.int64)
+                rows = matching if rows is None else np.intersect1d(rows, matching, assume_unique=True)
+        return rows
+
+    def _first_stage_scores(self, query, rows, first_stage):
+        """
+        Higher is better for both stages.
+        """
+        if first_stage == "binary":
+            codes = self.binary if rows is None else self.binary[rows]
+            query_bits = np.packbits(query > 0)
+            return -_popcount(np.bitwise_xor(codes, query_bits)).sum(axis=1, dtype=np.int32)
+        if first_stage == "int8":
+            codes = self.int8 if rows is None else self.int8[rows]
+            # x ~ codes * scale, so x . q ~ codes . (scale * q); quantize that weight vector to int8 as well.
+            weights = self.scale * query
+            weight_scale = np.abs(weights).max() / 127.0 or 1.0
+            query_codes = np.rint(weights / weight_scale).astype(np.int8)
+            return np.einsum("ij,j->i", codes, query_codes, dtype=np.int32)
+        raise ValueError(f"Unknown first stage: {first_stage}")
+
+    def search(self, query, top_k, where=None, first_stage=None, rescore=True):
+        """
+        Returns (row indices, cosine distances) of the `top_k` nearest chunks.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        rows = self._mask(where)
+        if rows is not None and not len(rows):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        first_stage = first_stage or self.first_stage
+
+        if first_stage == "exact":
+            vectors = np.asarray(self.vectors if rows is None else self.vectors[rows])
+            best = _top(vectors @ query, top_k)
+            candidates = best if rows is None else rows[best]
+        else:
+            scores = self._first_stage_scores(query, rows, first_stage)
+            shortlist = _top(scores, top_k * self.candidate_multiplier if rescore else top_k)
+            candidates = shortlist if rows is None else rows[shortlist]
+            if not rescore:
+                return candidates, None
+        # Sorted reads keep the memory-mapped access sequential.
+        candidates = np.sort(candidates)
+        similarities = np.asarray(self.vectors[candidates]) @ query
+        best = _top(similarities, top_k)
+        return candidates[best], 1.0 - similarities[best]
+
+    def query(self, query_embeddings, n_results, where=None):
+        """
+        Same call and result shape as chromadb's Collection.query, so KnowledgeBase can use either.
+        """
+        results = {"ids": [], "distances": [], "documents": [], "metadatas": []}
+        for query in query_embeddings:
+            rows, distances = self.search(query, n_results, where)
+            results["ids"].append([self.ids[i] for i in rows])
+            results["distances"].append([float(d) for d in distances])
+            results["documents"].append([self.documents[i] for i in rows])
+            results["metadatas"].append([self.metadatas[i] for i in rows])
+        return results
+
+    def get(self, ids=None, where=None):
+        """
+        Direct lookup by id and/or metadata filter, shaped like chromadb's Collection.get.
+        """
+        if ids is not None:
+            rows = [self.positions[chunk_id] for chunk_id in ids if chunk_id in self.positions]
+            if where:
+                allowed = set(self._mask(where).tolist())
+                rows = [i for i in rows if i in allowed]
+        else:
+            mask = self._mask(where)
+            rows = range(len(self.ids)) if mask is None else mask.tolist()
+        return {
+            "ids": [self.ids[i] for i in rows],
+            "documents": [self.documents[i] for i in rows],
+            "metadatas": [self.metadatas[i] for i in rows],
+        }
@@ -0,0 +1,173 @@
+# ----- SETUP -----
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from llm.llm_engines import LLMEngine
+# -----------------
+
+class EngineHealth:
+    def __init__(self, window=50):
+        """
+        Rolling latency and outcome window for one routed engine.
+        """
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+        self.lock = threading.Lock()
+
+    def p95(self, min_samples: int):
+        with self.lock:
+            if len(self.latencies) < min_samples:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def error_rate(self) -> float:
+        with self.lock:
+            if not self.outcomes:
+                return 0.0
+            return 1 - sum(self.outcomes) / len(self.outcomes)
+
+
+class RoutingLLMEngine(LLMEngine):
+    def __init__(self, engines, defaults=None, hedge_after=2.0, max_hedges=1, min_samples=5, window=50,
+                 error_rate_threshold=0.5, failure_threshold=3, cooldown=30.0, max_workers=8,
+                 clock=time.monotonic):
+        """
+        Routes each call across several engines in preference order.
+        A hedged duplicate is sent to the next healthy engine once the in-flight call passes that
+        engine's p95 latency (or `hedge_after` seconds until enough samples exist), and the first
+        successful answer wins. Engines that keep failing are taken out of rotation for `cooldown` seconds.
+        """
+        super().__init__("router", defaults)
+        if not engines:
+            raise ValueError("RoutingLLMEngine needs at least one engine")
+        self.engines = list(engines)
+        self.health = [EngineHealth(window) for _ in self.engines]
+        self.hedge_after = hedge_after
+        self.max_hedges = max_hedges
+        self.min_samples = min_samples
+        self.error_rate_threshold = error_rate_threshold
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        # Losing hedges keep running in the background until they return, so the pool must be
+        # large enough to absorb them without delaying new calls.
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-router")
+
+    def generate_response(self, params: dict) -> str:
+        candidates = self._candidates()
+        pending = {}
+        errors = []
+        launched = 0
+        started = None
+
+        def launch():
+            nonlocal launched, started
+            index = candidates[launched]
+            launched += 1
+            # Resolved with the start time once a pool worker actually runs the call.
+            started = Future()
+            pending[self.executor.submit(self._call, index, params, started)] = index
+
+        launch()
+        while pending:
+            can_hedge = launched < len(candidates) and len(pending) <= self.max_hedges
+            if can_hedge and not started.done():
+                # Time spent queued for a worker says nothing about the engine, so the hedge
+                # timer only starts once the latest call is running.
+                done, _ = wait([*pending, started], return_when=FIRST_COMPLETED)
+                done.discard(started)
+                if not done:
+                    continue
+            else:
+                timeout = None
+                if can_hedge:
+                    hedge_deadline = started.result() + self._hedge_delay(candidates[launched - 1])
+                    timeout = max(0.0, hedge_deadline - self.clock())
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    logging.info("Hedging LLM call to engine %d", candidates[launched])
+                    launch()
+                    continue
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    logging.warning("Routed engine %d failed: %s", index, e)
+                    errors.append(e)
+            # Every in-flight call failed, fail over to the next candidate right away.
+            if not pending and launched < len(candidates):
+                launch()
+        raise errors[-1]
+
+    def _call(self, index: int, params: dict, started: Future = None):
+        start = self.clock()
+        if started is not None:
+            started.set_result(start)
+        try:
+            result = self.engines[index].generate_response(params)
+        except Exception:
+            self._record(index, self.clock() - start, False)
+            raise
+        self._record(index, self.clock() - start, True)
+        return result
+
+    def _record(self, index: int, latency: float, ok: bool):
+        health = self.health[index]
+        with health.lock:
+            health.outcomes.append(ok)
+            if ok:
+                health.latencies.append(latency)
+                health.consecutive_failures = 0
+                return
+            health.consecutive_failures += 1
+            failed = len(health.outcomes) - sum(health.outcomes)
+            error_rate = failed / len(health.outcomes)
+            unhealthy = (
+                health.consecutive_failures >= self.failure_threshold or
+                (len(health.outcomes) >= self.min_samples and error_rate >= self.error_rate_threshold)
+            )
+            if unhealthy:
+                health.down_until = self.clock() + self.cooldown
+                # Start a fresh window once the cooldown ends, a single failure then re-trips it
+                # because consecutive_failures is kept.
+                health.outcomes.clear()
+        if unhealthy:
+            logging.warning("Routed engine %d taken out of rotation for %.0fs", index, self.cooldown)
+
+    def _hedge_delay(self, index: int) -> float:
+        p95 = self.health[index].p95(self.min_samples)
+        return p95 if p95 is not None else self.hedge_after
+
+    def _candidates(self):
+        """
+        Healthy engines in configured order. If every engine is cooling down, try them all,
+        soonest to recover first, rather than failing without a call.
+        """
+        now = self.clock()
+        healthy = [i for i, health in enumerate(self.health) if health.down_until <= now]
+        if healthy:
+            return healthy
+        return sorted(range(len(self.engines)), key=lambda i: self.health[i].down_until)
+
+    def stats(self):
+        """
+        Snapshot of the rolling health of each routed engine.
+        """
+        now = self.clock()
+        return [
+            {
+                "engine": type(engine).__name__,
+                "model_name": engine.model_name,
+                "p95": health.p95(self.min_samples),
+                "error_rate": health.error_rate(),
+                "healthy": health.down_until <= now,
+            }
+            for engine, health in zip(self.engines, self.health)
+        ]
@@ -0,0 +1,192 @@
+# ----- SETUP -----
+import heapq
+import itertools
+import random
+import threading
+import time
+# -----------------
+
+# Lower value is served first. Answer calls are what the user waits on, while rewrite/focus
+# calls are cheap helpers, so they must never hold an answer back when the budget is tight.
+PRIORITY_ANSWER = 0
+PRIORITY_REWRITE = 1
+
+def is_rate_limit_error(error) -> bool:
+    """
+    Groq raises RateLimitError (status_code=429), google.genai raises ClientError (code=429).
+    """
+    return getattr(error, "status_code", None) == 429 or getattr(error, "code", None) == 429
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_second: float, clock=time.monotonic):
+        """
+        Classic token bucket. The level may go negative when a call used more than it reserved,
+        which simply delays the following calls until the debt is refilled.
+        """
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.clock = clock
+        self.level = capacity
+        self.updated_at = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def time_until(self, amount: float) -> float:
+        """
+        Seconds until `amount` can be consumed, 0 if it can be consumed right now.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.refill_per_second
+
+    def consume(self, amount: float) -> float:
+        """
+        Take `amount` (capped at the capacity, so oversized calls can still run) and return what was taken.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        self.level -= amount
+        return amount
+
+    def adjust(self, amount: float):
+        """
+        Give back (positive) or take (negative) tokens after the real usage is known.
+        """
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RequestScheduler:
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, max_retries=5,
+                 backoff_base=1.0, backoff_max=30.0, clock=time.monotonic, sleep=time.sleep):
+        """
+        Admission control for one provider quota, shared by every engine instance using it.
+        Calls wait in a priority queue until both the request and the token bucket can pay for
+        them, and 429s are retried with full-jitter exponential backoff.
+        """
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0, clock)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0, clock)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.clock = clock
+        self.sleep = sleep
+
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        # Set after a 429 so the whole queue backs off together instead of stampeding the provider.
+        self._paused_until = 0.0
+
+    def run(self, call, estimated_tokens: int, priority=PRIORITY_ANSWER, usage=None):
+        """
+        Run `call()` once the quota allows it and return its result.
+        `usage(result)` may return the real token count, which settles the reservation.
+        """
+        attempt = 0
+        while True:
+            reserved = self._acquire(estimated_tokens, priority)
+            try:
+                result = call()
+            except Exception as e:
+                # A failed call produced no tokens; keeping its reservation would drain the bucket on every retry.
+                with self._cond:
+                    self.tokens.adjust(reserved)
+                    self._cond.notify_all()
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                self._back_off(attempt, _retry_after(e))
+                attempt += 1
+                continue
+
+            if usage is not None:
+                try:
+                    actual = usage(result)
+                except Exception:
+                    actual = None
+                if actual is not None:
+                    with self._cond:
+                        self.tokens.adjust(reserved - actual)
+                        self._cond.notify_all()
+            return result
+
+    def _acquire(self, estimated_tokens: int, priority: int) -> float:
+        """
+        Wait for a turn, then take one request and the estimated tokens. Returns the tokens taken.
+        """
+        with self._cond:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    if self._waiting[0] == ticket:
+                        wait = max(
+                            self._paused_until - self.clock(),
+                            self.requests.time_until(1),
+                            self.tokens.time_until(estimated_tokens),
+                        )
+                        if wait <= 0:
+                            self.requests.consume(1)
+                            return self.tokens.consume(estimated_tokens)
+                        self._cond.wait(timeout=wait)
+                    else:
+                        self._cond.wait()
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def _back_off(self, attempt: int, retry_after=None):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        with self._cond:
+            self._paused_until = max(self._paused_until, self.clock() + delay)
+            self._cond.notify_all()
+        self.sleep(delay)
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return len(self._waiting)
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(platform: str, rate_limits: dict = None):
+    """
+    Return the scheduler for a provider, creating it on first use. Quotas are per API key, so
+    every engine talking to the same platform must share one scheduler.
+    """
+    if not rate_limits:
+        return None
+    with _schedulers_lock:
+        scheduler = _schedulers.get(platform)
+        if scheduler is None:
+            scheduler = RequestScheduler(
+                rate_limits.get("requests_per_minute", 30),
+                rate_limits.get("tokens_per_minute", 6000),
+                max_retries=rate_limits.get("max_retries", 5),
+                backoff_base=rate_limits.get("backoff_base", 1.0),
+                backoff_max=rate_limits.get("backoff_max", 30.0),
+            )
+            _schedulers[platform] = scheduler
+        return scheduler
@@ -0,0 +1,242 @@
+# ----- SETUP -----
+import contextlib
+import contextvars
+import cProfile
+import io
+import itertools
+import logging
+import pstats
+import random
+import threading
+import time
+# -----------------
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_text(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_label_text(key)} {value}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[tuple(sorted(labels.items()))] = value
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_label_text(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [bucket counts..., sum, count]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, series in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_label_text(key + (('le', bound),))} {count}")
+                lines.append(f"{self.name}_bucket{_label_text(key + (('le', '+Inf'),))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_label_text(key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_label_text(key)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str = "") -> Counter:
+        return self._get_or_create(name, lambda: Counter(name, help_text))
+
+    def gauge(self, name: str, help_text: str = "") -> Gauge:
+        return self._get_or_create(name, lambda: Gauge(name, help_text))
+
+    def histogram(self, name: str, help_text: str = "", buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(name, lambda: Histogram(name, help_text, buckets))
+
+    def _get_or_create(self, name, factory):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = factory()
+            return metric
+
+    def export_text(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+        """
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class LazyFormat:
+    def __init__(self, fn, *args, **kwargs):
+        """
+        Defers building a log payload until a handler actually formats the record.
+        """
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):
+        return str(self.fn(*self.args, **self.kwargs))
+
+
+class Tracer:
+    def __init__(self, metrics: MetricsRegistry, sample_rate=0.0, log_payloads=False, logger=logging):
+        """
+        Per-stage spans over a query. Every span feeds the stage latency histogram, while only
+        sampled traces log their span timings and (if enabled) their prompt payloads.
+        """
+        self.metrics = metrics
+        self.sample_rate = sample_rate
+        self.log_payloads = log_payloads
+        self.logger = logger
+        self.stage_seconds = metrics.histogram("rag_stage_seconds", "Latency of each pipeline stage in seconds.")
+        self.tokens = metrics.counter("rag_llm_tokens_total", "LLM tokens by direction (in/out) and model.")
+        self.cache_lookups = metrics.counter("rag_cache_lookups_total", "Cache lookups by cache and result.")
+        self._trace = contextvars.ContextVar("rag_trace", default=None)
+        self._trace_ids = itertools.count(1)
+
+    def configure(self, config: dict = None):
+        config = config or {}
+        self.sample_rate = config.get("sample_rate", self.sample_rate)
+        self.log_payloads = config.get("log_payloads", self.log_payloads)
+
+    @contextlib.contextmanager
+    def trace(self, name="query"):
+        """
+        Opens a trace for one query; stage spans opened inside it are attributed to it.
+        """
+        trace = {"id": next(self._trace_ids), "sampled": random.random() < self.sample_rate}
+        token = self._trace.set(trace)
+        try:
+            with self.span(name):
+                yield trace
+        finally:
+            self._trace.reset(token)
+
+    @contextlib.contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stage_seconds.observe(elapsed, stage=stage)
+            trace = self._trace.get()
+            if trace and trace["sampled"]:
+                self.logger.info("trace=%d span=%s seconds=%.4f", trace["id"], stage, elapsed)
+
+    def sampled(self) -> bool:
+        trace = self._trace.get()
+        return bool(trace and trace["sampled"])
+
+    def payload(self, label: str, value, *args, **kwargs):
+        """
+        Log a prompt/context payload for sampled traces only. `value` may be a callable, in which
+        case it is only called when the record is emitted.
+        """
+        if not (self.log_payloads and self.sampled()):
+            return
+        if callable(value):
+            value = LazyFormat(value, *args, **kwargs)
+        self.logger.info("trace=%d %s: %s", self._trace.get()["id"], label, value)
+
+    def record_tokens(self, model: str, tokens_in, tokens_out):
+        if tokens_in:
+            self.tokens.inc(tokens_in, direction="in", model=model)
+        if tokens_out:
+            self.tokens.inc(tokens_out, direction="out", model=model)
+
+    def record_cache(self, cache: str, hit: bool):
+        self.cache_lookups.inc(cache=cache, result="hit" if hit else "miss")
+
+    @contextlib.contextmanager
+    def profile(self, output_path=None, sort_by="cumulative", limit=30):
+        """
+        Attach cProfile to the enclosed block (typically a single query). Stats are dumped to
+        `output_path` if given, and the top entries are logged.
+        """
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+            if output_path:
+                profiler.dump_stats(output_path)
+            buffer = io.StringIO()
+            pstats.Stats(profiler, stream=buffer).sort_stats(sort_by).print_stats(limit)
+            self.logger.info("Query profile:\n%s", buffer.getvalue())
+
+
+metrics = MetricsRegistry()
+tracer = Tracer(metrics)
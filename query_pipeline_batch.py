@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from tqdm import tqdm
+
+with open("config.json", "r") as f:
+  config = json.load(f)
+
+from llm.llm_manager import ERROR_RESPONSE, LLMManager
+
+# Answers a JSONL file of questions, one {"id": ..., "question": ..., "session": ...} object per line.
+# Questions sharing a "session" are answered in file order against one chat history; questions without
+# one (or every question with --stateless) are independent. Results are appended to the output JSONL
+# as they finish, which doubles as the checkpoint: rerunning with the same output skips answered ids.
+# Failed questions are written with an "error" field and are retried on the next run; on resume the
+# output is compacted to the last successful record per id, so it never holds two records for one id.
+
+def load_questions(path):
+  """
+  Raises ValueError naming the line of the first malformed record, before any question is answered.
+  """
+  questions = []
+  with open(path, "r", encoding="utf-8") as f:
+    for line_number, line in enumerate(f, 1):
+      if not line.strip():
+        continue
+      try:
+        record = json.loads(line)
+      except json.JSONDecodeError as e:
+        raise ValueError(f"{path}:{line_number}: invalid JSON ({e})")
+      if not isinstance(record, dict):
+        raise ValueError(f"{path}:{line_number}: expected a JSON object")
+      record.setdefault("id", str(line_number))
+      record["id"] = str(record["id"])
+      if "question" not in record and "query" in record:
+        record["question"] = record["query"]
+      if not isinstance(record.get("question"), str) or not record["question"].strip():
+        raise ValueError(f"{path}:{line_number}: missing a non-empty \"question\" (or \"query\")")
+      questions.append(record)
+  return questions
+
+def load_checkpoint(path):
+  """
+  Results already written by a previous (possibly interrupted) run, keyed by question id.
+  """
+  done = {}
+  if not os.path.exists(path):
+    return done
+  with open(path, "r", encoding="utf-8") as f:
+    for line in f:
+      try:
+        result = json.loads(line)
+      except json.JSONDecodeError:
+        # A run killed mid-write can leave a truncated last line, that question is simply redone.
+        continue
+      if result.get("error"):
+        continue
+      done[result["id"]] = result
+  return done
+
+def compact_results(path, done):
+  """
+  Rewrite the results file with only the checkpointed records, dropping error lines of questions
+  that are about to be retried and any truncated last line.
+  """
+  temp_path = f"{path}.tmp"
+  with open(temp_path, "w", encoding="utf-8") as f:
+    for result in done.values():
+      f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+  os.replace(temp_path, path)
+
+def group_questions(questions, stateless):
+  """
+  Split questions into units of work: one per stateless question, one per session.
+  """
+  units = []
+  sessions = OrderedDict()
+  for record in questions:
+    session = None if stateless else record.get("session")
+    if session is None:
+      units.append((None, [record]))
+    else:
+      sessions.setdefault(str(session), []).append(record)
+  units.extend(sessions.items())
+  return units
+
+class ResultWriter:
+  def __init__(self, path):
+    self._drop_partial_line(path)
+    self.file = open(path, "a", encoding="utf-8")
+    self.lock = threading.Lock()
+
+  @staticmethod
+  def _drop_partial_line(path):
+    # Cut off a line left unfinished by an interrupted run so new results start on a fresh line.
+    if not os.path.exists(path):
+      return
+    with open(path, "rb+") as f:
+      content = f.read()
+      if content and not content.endswith(b"\n"):
+        f.truncate(content.rfind(b"\n") + 1)
+
+  def write(self, result):
+    with self.lock:
+      self.file.write(json.dumps(result, ensure_ascii=False) + "\n")
+      self.file.flush()
+      os.fsync(self.file.fileno())
+
+  def close(self):
+    self.file.close()
+
+def run_unit(manager, session, records, done, writer, progress, stop, use_answer_cache=False):
+  """
+  Answer one unit in order. Returns the number of failed questions.
+  A failure ends a session unit, so its later turns are answered after the failed one on resume.
+  """
+  chat_history = manager.new_chat_history() if session is not None else None
+  for record in records:
+    if stop.is_set():
+      return 0
+    if record["id"] in done:
+      # Replay answered turns so the rest of the session sees the same conversation.
+      if chat_history is not None:
+        chat_history.inqueue_message("user", record["question"])
+        chat_history.inqueue_message("assistant", done[record["id"]]["answer"])
+      continue
+    start = time.perf_counter()
+    answer = manager.query(record["question"], chat_history=chat_history, use_answer_cache=use_answer_cache)
+    failed = answer == ERROR_RESPONSE
+    writer.write({
+      "id": record["id"],
+      "session": session,
+      "question": record["question"],
+      "answer": None if failed else answer,
+      "seconds": round(time.perf_counter() - start, 4),
+      **({"error": answer} if failed else {}),
+    })
+    progress.update(1)
+    if failed:
+      return 1
+  return 0
+
+def main():
+  parser = argparse.ArgumentParser(description="Answer a JSONL file of questions.")
+  parser.add_argument("input", help="JSONL file with one question object per line")
+  parser.add_argument("output", help="JSONL results file, also used as the resume checkpoint")
+  parser.add_argument("--workers", type=int, default=config.get('batch', {}).get('workers', 4))
+  parser.add_argument("--stateless", action="store_true", help="answer every question independently, ignoring sessions")
+  parser.add_argument(
+    "--answer-cache", action="store_true",
+    help="serve cached answers to paraphrased stateless questions (off by default so regression runs always generate)"
+  )
+  args = parser.parse_args()
+
+  try:
+    questions = load_questions(args.input)
+  except ValueError as e:
+    parser.error(str(e))
+  done = load_checkpoint(args.output)
+  if os.path.exists(args.output):
+    compact_results(args.output, done)
+  remaining = sum(1 for record in questions if record["id"] not in done)
+  print(f"{len(questions)} questions, {len(questions) - remaining} already answered, {remaining} to go.")
+  if not remaining:
+    return
+
+  manager = LLMManager(config, False, log_dir=config.get('log_dir', None))
+  writer = ResultWriter(args.output)
+  pool = ThreadPoolExecutor(max_workers=args.workers)
+  stop = threading.Event()
+  start = time.perf_counter()
+  try:
+    failures = 0
+    with tqdm(total=remaining) as progress:
+      futures = [
+        pool.submit(run_unit, manager, session, records, done, writer, progress, stop, args.answer_cache)
+        for session, records in group_questions(questions, args.stateless)
+        if any(record["id"] not in done for record in records)
+      ]
+      for future in as_completed(futures):
+        failures += future.result()
+    print(f"Finished in {time.perf_counter() - start:.1f}s.")
+    if failures:
+      print(f"{failures} questions failed, rerun the same command to retry them.")
+  except KeyboardInterrupt:
+    print("\nKeyboard interrupt received, rerun the same command to resume.")
+  finally:
+    # Questions already in flight finish and are written; running session units stop before their
+    # next question and queued units are cancelled, all left for the resume.
+    stop.set()
+    pool.shutdown(wait=True, cancel_futures=True)
+    writer.close()
+
+if __name__ == "__main__":
+  main()
@@ -1,4 +1,6 @@
 import json
+import datetime
+import os
 
 with open("config.json", "r") as f:
     config = json.load(f)
@@ -14,7 +16,17 @@ if __name__ == "__main__":
       if user_input.strip().lower() == "exit":
         print("Exiting.")
         break
-      response = llm_manager.query(user_input)
+      # "metrics" dumps stage timings and counters, "profile <query>" runs one query under cProfile.
+      if user_input.strip().lower() == "metrics":
+        print(llm_manager.export_metrics())
+        continue
+      profile_path = None
+      if user_input.strip().lower().startswith("profile "):
+        user_input = user_input.strip()[len("profile "):]
+        profile_dir = os.path.join(config.get('log_dir') or "logs", "profiles")
+        os.makedirs(profile_dir, exist_ok=True)
+        profile_path = os.path.join(profile_dir, f"{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.prof")
+      response = llm_manager.query(user_input, profile_path=profile_path)
       print("LLM Response:", response)
   except KeyboardInterrupt:
     print("\nKeyboard interrupt received. Exiting.")
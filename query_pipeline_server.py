@@ -0,0 +1,168 @@
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+with open("config.json", "r") as f:
+    config = json.load(f)
+
+from chat.session_store import SessionStore
+from llm.llm_manager import LLMManager
+from llm.llm_tracing import tracer
+
+# One manager (embedder, knowledge base, engines) is shared by every session, each session only owns its chat history.
+
+class AdmissionGate:
+  def __init__(self, max_concurrent, max_queue, queue_timeout):
+    """
+    Bounds the number of queries in the pipeline. Up to `max_queue` requests wait at most
+    `queue_timeout` seconds for a slot, anything beyond that is rejected straight away.
+    """
+    self.slots = threading.BoundedSemaphore(max_concurrent)
+    self.max_pending = max_concurrent + max_queue
+    self.queue_timeout = queue_timeout
+    self.pending = 0
+    self.lock = threading.Lock()
+
+  def acquire(self):
+    with self.lock:
+      if self.pending >= self.max_pending:
+        return False
+      self.pending += 1
+    if self.slots.acquire(timeout=self.queue_timeout):
+      return True
+    with self.lock:
+      self.pending -= 1
+    return False
+
+  def release(self):
+    self.slots.release()
+    with self.lock:
+      self.pending -= 1
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+  manager = None
+  sessions = None
+  gate = None
+  retry_after = 1
+  max_body_bytes = 64 * 1024
+
+  def do_GET(self):
+    if self.path == "/health":
+      self._send_json(200, {"status": "ok", "sessions": len(self.sessions)})
+    elif self.path == "/metrics":
+      self._send(200, self.manager.export_metrics().encode("utf-8"), "text/plain; version=0.0.4")
+    else:
+      self._send_json(404, {"error": "not found"})
+
+  def do_POST(self):
+    if self.path != "/query":
+      self._send_json(404, {"error": "not found"})
+      return
+    try:
+      length = int(self.headers.get("Content-Length", 0))
+    except ValueError:
+      self._send_json(400, {"error": "invalid Content-Length"})
+      return
+    if length < 0:
+      self._send_json(400, {"error": "invalid Content-Length"})
+      return
+    if length > self.max_body_bytes:
+      # The body is left unread, so the connection cannot be reused.
+      self.close_connection = True
+      self._send_json(413, {"error": f"request body larger than {self.max_body_bytes} bytes"})
+      return
+    try:
+      body = json.loads(self.rfile.read(length) or b"{}")
+    except ValueError:
+      self._send_json(400, {"error": "invalid JSON body"})
+      return
+    if not isinstance(body, dict):
+      self._send_json(400, {"error": "JSON body must be an object"})
+      return
+    query = body.get("query")
+    if not isinstance(query, str) or not query.strip():
+      self._send_json(400, {"error": "'query' must be a non-empty string"})
+      return
+
+    if not self.gate.acquire():
+      tracer.metrics.counter("rag_server_rejected_total", "Queries rejected because the server was saturated.").inc()
+      self._send_json(503, {"error": "server busy, retry later"}, {"Retry-After": str(self.retry_after)})
+      return
+    try:
+      if body.get("stateless"):
+        self._send_json(200, {"answer": self.manager.query(query)})
+        return
+      session_id = body.get("session_id") or uuid.uuid4().hex
+      session = self.sessions.get(session_id)
+      with session.lock:
+        answer = self.manager.query(query, chat_history=session.chat_history)
+      self._send_json(200, {"session_id": session_id, "answer": answer})
+    finally:
+      self.gate.release()
+
+  def do_DELETE(self):
+    if not self.path.startswith("/session/"):
+      self._send_json(404, {"error": "not found"})
+      return
+    dropped = self.sessions.drop(self.path[len("/session/"):])
+    self._send_json(200 if dropped else 404, {"dropped": dropped})
+
+  def _send_json(self, status, payload, headers=None):
+    self._send(status, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+  def _send(self, status, body, content_type, headers=None):
+    self.send_response(status)
+    self.send_header("Content-Type", content_type)
+    self.send_header("Content-Length", str(len(body)))
+    for key, value in (headers or {}).items():
+      self.send_header(key, value)
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, format, *args):
+    # Request lines go to the manager's log instead of stderr.
+    pass
+
+
+def serve(config):
+  server_config = config.get('server', {})
+  manager = LLMManager(config, False, log_dir=config.get('log_dir', None))
+  sessions = SessionStore(
+    manager.new_chat_history,
+    max_sessions=server_config.get('max_sessions', 256),
+    idle_timeout=server_config.get('session_idle_timeout', 1800),
+  )
+  QueryHandler.manager = manager
+  QueryHandler.sessions = sessions
+  QueryHandler.gate = AdmissionGate(
+    server_config.get('max_concurrent', 8),
+    server_config.get('max_queue', 32),
+    server_config.get('queue_timeout', 10),
+  )
+  QueryHandler.retry_after = server_config.get('retry_after', 1)
+  QueryHandler.max_body_bytes = server_config.get('max_body_bytes', 64 * 1024)
+
+  def evict_idle_sessions(stop):
+    while not stop.wait(60):
+      sessions.evict_idle()
+
+  stop = threading.Event()
+  threading.Thread(target=evict_idle_sessions, args=(stop,), daemon=True).start()
+
+  host, port = server_config.get('host', "127.0.0.1"), server_config.get('port', 8000)
+  httpd = ThreadingHTTPServer((host, port), QueryHandler)
+  httpd.daemon_threads = True
+  print(f"Serving on http://{host}:{port}")
+  try:
+    httpd.serve_forever()
+  except KeyboardInterrupt:
+    print("\nKeyboard interrupt received. Exiting.")
+  finally:
+    stop.set()
+    httpd.server_close()
+
+
+if __name__ == "__main__":
+  serve(config)
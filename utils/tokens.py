@@ -0,0 +1,11 @@
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text) -> int:
+    """
+    Rough token estimate for a prompt, good enough to budget against a tokens-per-minute quota
+    or a history's token limit.
+    """
+    if not text:
+        return 0
+    return len(text) // CHARS_PER_TOKEN + 1